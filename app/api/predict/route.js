@@ -1,6 +1,52 @@
 import { NextResponse } from 'next/server';
 import { spawn } from 'child_process';
 import path from 'path';
+import net from 'net';
+
+// Ask a resident prediction_server.py over its Unix socket
+function predictViaSocket(socketPath, inputData) {
+  return new Promise((resolve, reject) => {
+    const client = net.createConnection(socketPath);
+    let buffer = '';
+    let settled = false;
+
+    client.setTimeout(30000, () => {
+      client.destroy(new Error('Prediction server timeout after 30 seconds'));
+    });
+
+    client.on('connect', () => {
+      client.write(inputData + '\n');
+    });
+
+    client.on('data', (data) => {
+      buffer += data.toString();
+      const newline = buffer.indexOf('\n');
+      if (newline !== -1) {
+        settled = true;
+        client.end();
+        try {
+          resolve(JSON.parse(buffer.slice(0, newline)));
+        } catch (parseError) {
+          reject(parseError);
+        }
+      }
+    });
+
+    client.on('error', (error) => {
+      settled = true;
+      reject(error);
+    });
+
+    // A worker that dies mid-request closes the socket without answering,
+    // and closing also cancels the idle timeout, so reject here
+    client.on('close', () => {
+      if (!settled) {
+        settled = true;
+        reject(new Error('Prediction server closed the connection without a response'));
+      }
+    });
+  });
+}
 
 export async function POST(req) {
   try {
@@ -12,14 +58,28 @@ export async function POST(req) {
       }, { status: 400 });
     }
 
-    return new Promise((resolve) => {
-      // Create prediction script input
-      const inputData = JSON.stringify({
-        professor: professorName,
-        subject: subject,
-        reviews: reviews
-      });
+    // Create prediction script input
+    const inputData = JSON.stringify({
+      professor: professorName,
+      subject: subject,
+      reviews: reviews
+    });
+
+    // Prefer the resident prediction server when one is configured
+    const socketPath = process.env.PREDICTION_SERVER_SOCKET;
+    if (socketPath) {
+      try {
+        const result = await predictViaSocket(socketPath, inputData);
+        return NextResponse.json({ 
+          success: true, 
+          prediction: result
+        });
+      } catch (serverError) {
+        console.warn('Prediction server unavailable, falling back to script:', serverError.message);
+      }
+    }
 
+    return new Promise((resolve) => {
       // Run Python prediction script
       const pythonProcess = spawn('python3', [
         path.join(process.cwd(), 'predict_professor.py')
@@ -1,9 +1,18 @@
 import { NextResponse } from "next/server";
+import { spawn } from 'child_process';
+import crypto from 'crypto';
 import fs from 'fs';
 import path from 'path';
 import { Pinecone } from '@pinecone-database/pinecone';
 import fetch from 'node-fetch';
 
+// Same id as review_stream.review_id(), so the bulk embedding pipeline and
+// uploads upsert each review under one vector id instead of two
+function reviewId(review) {
+  const payload = JSON.stringify([review.professor ?? null, review.subject ?? null, review.review ?? null]);
+  return crypto.createHash('sha1').update(payload, 'utf8').digest('hex');
+}
+
 export async function POST(req) {
   try {
     const reviewsFilePath = path.join(process.cwd(), 'data', 'reviews.json');
@@ -24,6 +33,44 @@ export async function POST(req) {
     // Write the combined reviews back to the file
     fs.writeFileSync(reviewsFilePath, JSON.stringify({ reviews: updatedReviews }, null, 2));
 
+    // Optional: append the new reviews to the local embedding index in the background
+    if (process.env.LOCAL_EMBEDDING_INDEX) {
+      const indexProcess = spawn('python3', [
+        path.join(process.cwd(), 'embedding_index.py'),
+        '--index', process.env.LOCAL_EMBEDDING_INDEX,
+        'sync', '--data', reviewsFilePath,
+      ], { detached: true, stdio: 'ignore' });
+      indexProcess.on('error', (e) => console.warn('Local embedding index sync failed to start', e));
+      indexProcess.unref();
+    }
+
+    // Optional: fold the new reviews into the published models and the professor
+    // aggregate index in the background. When both are enabled the index update
+    // runs after the model update, so it scores the new reviews with the new
+    // version instead of racing it.
+    const updateArgs = [path.join(process.cwd(), 'train_model.py'), '--update', '--data', reviewsFilePath];
+    const aggregateArgs = process.env.PROFESSOR_INDEX && [
+      path.join(process.cwd(), 'professor_index.py'),
+      '--index', process.env.PROFESSOR_INDEX,
+      'update', '--data', reviewsFilePath,
+    ];
+    if (process.env.INCREMENTAL_MODEL_UPDATES && aggregateArgs) {
+      // The index is updated even if the model update fails or finds nothing new
+      const chainProcess = spawn('sh', [
+        '-c', 'python3 "$1" "$2" "$3" "$4" ; shift 4 ; python3 "$@"', 'sh', ...updateArgs, ...aggregateArgs,
+      ], { detached: true, stdio: 'ignore' });
+      chainProcess.on('error', (e) => console.warn('Model and professor index update failed to start', e));
+      chainProcess.unref();
+    } else if (process.env.INCREMENTAL_MODEL_UPDATES) {
+      const updateProcess = spawn('python3', updateArgs, { detached: true, stdio: 'ignore' });
+      updateProcess.on('error', (e) => console.warn('Incremental model update failed to start', e));
+      updateProcess.unref();
+    } else if (aggregateArgs) {
+      const aggregateProcess = spawn('python3', aggregateArgs, { detached: true, stdio: 'ignore' });
+      aggregateProcess.on('error', (e) => console.warn('Professor index update failed to start', e));
+      aggregateProcess.unref();
+    }
+
     // Optional: Upsert new reviews into Pinecone if creds exist
     const pineconeKey = process.env.PINECONE_API_KEY;
     const hfKey = process.env.HUGGINGFACE_API_TOKEN;
@@ -60,7 +107,7 @@ export async function POST(req) {
         try {
           const vector = await embed(text);
           vectors.push({
-            id: `rev_${Date.now()}_${i}`,
+            id: reviewId(r),
             values: vector,
             metadata: {
               professor: r.professor || '',
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Training and Prediction Benchmarks
+Times every stage of the pipeline on synthetic corpora of increasing size so
+changes in throughput, latency or memory between versions are visible.
+
+    python3 benchmark.py --sizes 1000 10000 100000 --output bench.json
+    python3 benchmark.py --sizes 1000 10000 --compare bench.json
+
+Each corpus size runs in a fresh process, so peak RSS is measured per size.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Base subjects with course numbers appended, drawn with a Zipf-like skew
+SUBJECT_AREAS = [
+    'Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'History',
+    'Psychology', 'Economics', 'Philosophy', 'Sociology', 'Political Science', 'Statistics', 'Art History',
+    'Music', 'Spanish', 'Arabic', 'Engineering', 'Accounting', 'Nursing',
+]
+COURSE_LEVELS = [101, 102, 150, 201, 202, 301, 328, 401]
+
+FIRST_NAMES = ['Alex', 'Sarah', 'Maria', 'James', 'Michael', 'Lisa', 'Robert', 'Jennifer', 'David', 'Amanda',
+               'Thomas', 'Rachel', 'Mark', 'Emily', 'John', 'Jane', 'Wei', 'Priya', 'Omar', 'Sofia']
+LAST_NAMES = ['Chen', 'Williams', 'Rodriguez', 'Thompson', 'Davis', 'Brown', 'Wilson', 'Lee', 'Kim', 'Johnson',
+              'Anderson', 'Green', 'Taylor', 'Smith', 'Doe', 'Patel', 'Nguyen', 'Garcia', 'Haddad', 'Rossi']
+TITLES = ['Dr.', 'Prof.']
+
+# Review phrases by sentiment; star ratings pick mostly from the matching bucket
+PHRASES = {
+    'positive': [
+        "Explains concepts very clearly and gives great examples.",
+        "Always available in office hours and happy to help.",
+        "Makes a difficult subject enjoyable and understandable.",
+        "Lectures are engaging and well organized.",
+        "Fair exams that match what was taught in class.",
+        "Really cares about students learning the material.",
+        "Best professor I've had, highly recommend!",
+    ],
+    'neutral': [
+        "Knows the material well but moves quickly.",
+        "Homework is challenging but you learn a lot.",
+        "Lectures can be dry, though the content is interesting.",
+        "Tough grader but gives useful feedback.",
+        "Decent class if you keep up with the readings.",
+        "Exams are hard, so start studying early.",
+    ],
+    'negative': [
+        "Disorganized lectures and unclear expectations.",
+        "Doesn't respond to emails and rarely holds office hours.",
+        "Tests don't match what's taught in class.",
+        "Hard to follow and doesn't explain things clearly.",
+        "Grading feels arbitrary and inconsistent.",
+        "Avoid if possible, I wouldn't take this class again.",
+    ],
+}
+SENTIMENT_BY_STARS = {1: 'negative', 2: 'negative', 3: 'neutral', 4: 'positive', 5: 'positive'}
+STAR_WEIGHTS = np.array([0.08, 0.12, 0.2, 0.28, 0.32])
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+PREDICT_REQUESTS = 200
+REVIEWS_PER_REQUEST = 10
+
+def generate_reviews(n_reviews, n_professors=None, n_subjects=60, seed=42):
+    """Yield n_reviews synthetic reviews with a skewed professor and subject spread
+
+    Professors default to one per ~25 reviews. Each professor teaches one
+    subject and has a latent quality that drives their star ratings, so the
+    corpus is learnable. Output is deterministic for a given seed.
+    """
+    rng = np.random.default_rng(seed)
+    n_professors = n_professors or max(10, n_reviews // 25)
+
+    subjects = [f"{area} {level}" for area in SUBJECT_AREAS for level in COURSE_LEVELS][:n_subjects]
+    subject_weights = 1.0 / np.arange(1, len(subjects) + 1)
+    subject_weights /= subject_weights.sum()
+
+    professor_names = [
+        f"{TITLES[i % 2]} {FIRST_NAMES[(i // 2) % len(FIRST_NAMES)]} {LAST_NAMES[(i // 40) % len(LAST_NAMES)]}"
+        + (f" {i // 800}" if i >= 800 else '')
+        for i in range(n_professors)
+    ]
+    professor_subjects = rng.choice(len(subjects), n_professors, p=subject_weights)
+    professor_quality = rng.normal(0, 1, n_professors)
+
+    # Popular professors get more reviews
+    professor_weights = rng.pareto(1.5, n_professors) + 1
+    professor_weights /= professor_weights.sum()
+
+    phrase_counts = rng.integers(1, 4, n_reviews)
+    reviews_professor = rng.choice(n_professors, n_reviews, p=professor_weights)
+    base_stars = rng.choice(5, n_reviews, p=STAR_WEIGHTS) + 1
+    for i in range(n_reviews):
+        professor = reviews_professor[i]
+        stars = int(np.clip(round(base_stars[i] + professor_quality[professor]), 1, 5))
+        phrases = []
+        for _ in range(phrase_counts[i]):
+            # One phrase in five comes from another sentiment bucket, like real mixed reviews
+            sentiment = SENTIMENT_BY_STARS[stars] if rng.random() > 0.2 else rng.choice(list(PHRASES))
+            bucket = PHRASES[sentiment]
+            phrases.append(bucket[rng.integers(len(bucket))])
+        yield {
+            'professor': professor_names[professor],
+            'subject': subjects[professor_subjects[professor]],
+            'stars': stars,
+            'review': ' '.join(phrases),
+        }
+
+def write_corpus(path, n_reviews, seed=42):
+    """Write a synthetic corpus in the data/reviews.json format without holding it in memory"""
+    with open(path, 'w') as f:
+        f.write('{"reviews": [\n')
+        for i, review in enumerate(generate_reviews(n_reviews, seed=seed)):
+            if i:
+                f.write(',\n')
+            f.write(json.dumps(review))
+        f.write('\n]}\n')
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p90_ms': float(np.percentile(samples, 90)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max()),
+    }
+
+class StageTimer:
+    """Wall-clock time and, optionally, peak traced Python allocations per stage"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            result = {'seconds': seconds}
+            if items:
+                result['items'] = items
+                result['items_per_second'] = items / seconds if seconds > 0 else None
+            if self.trace_memory:
+                result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+            self.stages[name] = result
+
+def _prediction_groups(df, n_requests, reviews_per_request, seed):
+    """Sample professors and up to reviews_per_request of their reviews, like /api/predict requests"""
+    rng = np.random.default_rng(seed)
+    grouped = df.groupby('professor')
+    names = list(grouped.groups)
+    groups = []
+    for name in rng.choice(names, min(n_requests, len(names)), replace=False):
+        rows = grouped.get_group(name)
+        groups.append({
+            'professor': name,
+            'subject': rows['subject'].iloc[0],
+            'reviews': list(rows['review'].iloc[:reviews_per_request]),
+        })
+    return groups
+
+def run_size(n_reviews, trace_memory=False, n_jobs=-1, seed=42):
+    """Benchmark every stage on one corpus size; runs inside a fresh worker process"""
+    work_dir = tempfile.mkdtemp(prefix='professor-bench-')
+    try:
+        return _run_stages(n_reviews, work_dir, trace_memory, n_jobs, seed)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def _run_stages(n_reviews, work_dir, trace_memory, n_jobs, seed):
+    import pandas as pd
+    from train_model import ProfessorRecommendationModel
+    from professor_predictor import load_predictor
+
+    timer = StageTimer(trace_memory)
+    data_path = os.path.join(work_dir, 'reviews.json')
+
+    with timer.stage('generate', n_reviews):
+        write_corpus(data_path, n_reviews, seed)
+
+    model = ProfessorRecommendationModel(os.path.join(work_dir, 'models'), n_jobs=n_jobs)
+
+    with timer.stage('load', n_reviews):
+        with open(data_path, 'r') as f:
+            df = model.clean_reviews(pd.DataFrame(json.load(f)['reviews']))
+
+    with timer.stage('preprocess', len(df)):
+        processed = model.text_preprocessor.preprocess_many(df['review'])
+
+    with timer.stage('vectorize', len(df)):
+        text_features = model.vectorizer.fit_transform(processed)
+        model.subject_encoder.fit(df['subject'].fillna('Unknown'))
+    del processed, text_features
+
+    # Full featurization as train() does it, reused for fitting
+    with timer.stage('featurize', len(df)):
+        X = model.extract_features(df, is_training=True).tocsr()
+    y_rating = df['stars'].values
+    y_difficulty = np.clip(6 - y_rating, 1, 5)
+
+    with timer.stage('fit', len(df)):
+        model.rating_model.fit(X, y_rating)
+        model.difficulty_model.fit(X, y_difficulty)
+
+    with timer.stage('save'):
+        model.save_models()
+
+    # Load the way predict_professor.py and the prediction server do
+    with timer.stage('model_load'):
+        loaded, models_loaded = load_predictor(model.model_dir)
+        if not models_loaded:
+            raise RuntimeError(f"Could not load the models saved in {model.model_dir}")
+
+    # Warm up once so lazily initialized state is not billed to the first request
+    groups = _prediction_groups(df, PREDICT_REQUESTS, REVIEWS_PER_REQUEST, seed)
+    loaded.predict_professor_metrics_batch(groups[:1])
+
+    latencies = []
+    with timer.stage('predict', len(groups)):
+        for group in groups:
+            start = time.perf_counter()
+            loaded.predict_professor_metrics(group['professor'], group['subject'], group['reviews'])
+            latencies.append(time.perf_counter() - start)
+    timer.stages['predict'].update(percentiles(latencies))
+
+    with timer.stage('predict_batch', len(groups)):
+        loaded.predict_professor_metrics_batch(groups)
+
+    return {
+        'reviews': n_reviews,
+        'professors': int(df['professor'].nunique()),
+        'subjects': int(df['subject'].nunique()),
+        'features': int(X.shape[1]),
+        'stages': timer.stages,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+def _peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+def _environment():
+    import sklearn
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare(results, baseline, threshold=0.1):
+    """Print per-stage slowdowns against a baseline; returns True if any stage regressed"""
+    baseline_runs = {run['reviews']: run for run in baseline['runs']}
+    regressed = False
+    for run in results['runs']:
+        base = baseline_runs.get(run['reviews'])
+        if base is None:
+            continue
+        print(f"\n{run['reviews']} reviews vs {baseline['environment'].get('commit') or 'baseline'}:")
+        for stage, current in run['stages'].items():
+            if stage not in base['stages'] or not base['stages'][stage]['seconds']:
+                continue
+            ratio = current['seconds'] / base['stages'][stage]['seconds']
+            flag = 'REGRESSION' if ratio > 1 + threshold else ''
+            regressed = regressed or bool(flag)
+            print(f"  {stage:<14} {base['stages'][stage]['seconds']:9.3f}s -> {current['seconds']:9.3f}s  "
+                  f"x{ratio:5.2f} {flag}")
+        rss_ratio = run['peak_rss_mb'] / base['peak_rss_mb']
+        print(f"  {'peak rss':<14} {base['peak_rss_mb']:8.1f}MB -> {run['peak_rss_mb']:8.1f}MB  x{rss_ratio:5.2f}")
+    return regressed
+
+def print_run(run):
+    print(f"\n{run['reviews']} reviews, {run['professors']} professors, {run['subjects']} subjects, "
+          f"{run['features']} features, peak RSS {run['peak_rss_mb']:.1f}MB")
+    for stage, result in run['stages'].items():
+        line = f"  {stage:<14} {result['seconds']:9.3f}s"
+        if result.get('items_per_second'):
+            line += f"  {result['items_per_second']:12.1f}/s"
+        if 'p50_ms' in result:
+            line += f"  p50 {result['p50_ms']:.2f}ms p90 {result['p90_ms']:.2f}ms p99 {result['p99_ms']:.2f}ms"
+        if 'peak_traced_mb' in result:
+            line += f"  peak {result['peak_traced_mb']:.1f}MB"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark training and prediction on synthetic corpora')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Corpus sizes in reviews')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown ratio reported as a regression')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Record peak Python allocations per stage (slows every stage down)')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Cores used for tree building')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    results = {'environment': _environment(), 'runs': []}
+    context = multiprocessing.get_context('spawn')
+    for n_reviews in args.sizes:
+        # A fresh process per size keeps peak RSS and warm caches from leaking between sizes
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            run = executor.submit(run_size, n_reviews, args.trace_memory, args.n_jobs, args.seed).result()
+        results['runs'].append(run)
+        print_run(run)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
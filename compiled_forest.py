@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Compiled Forest Inference
+Flattens fitted RandomForestRegressor models into contiguous NumPy arrays and
+evaluates every tree for a batch of rows at once.
+
+All forests are stored in one .npy file holding a single structured record
+whose fields are the node and tree arrays. Loading is an np.load(mmap_mode='r'),
+so worker processes share one copy of the model through the page cache.
+"""
+
+import numpy as np
+
+# Rows evaluated together; bounds the (rows x trees) working arrays
+PREDICT_BATCH_SIZE = 4096
+
+def compile_forests(forests):
+    """Flatten fitted forests into one structured record of contiguous arrays"""
+    features, lefts, rights, thresholds, values = [], [], [], [], []
+    roots, tree_forest, tree_depth = [], [], []
+    offset = 0
+
+    for forest_id, forest in enumerate(forests):
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(offset, offset + n_nodes, dtype=np.int32)
+
+            # Leaves point back at themselves with an infinite threshold, so the
+            # evaluator can take a fixed number of steps without masking
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset).astype(np.int32))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+            values.append(tree.value[:, 0, 0].astype(np.float64))
+
+            roots.append(offset)
+            tree_forest.append(forest_id)
+            tree_depth.append(tree.max_depth)
+            offset += n_nodes
+
+    return _build_record(
+        np.concatenate(thresholds), np.concatenate(values), np.concatenate(features),
+        np.concatenate(lefts), np.concatenate(rights), roots, tree_forest, tree_depth
+    )
+
+def _build_record(threshold, value, feature, left, right, root, forest, depth):
+    """Pack node and tree arrays into one structured record"""
+    n_nodes = len(threshold)
+    n_trees = len(root)
+    # Float fields first so every field stays naturally aligned
+    dtype = np.dtype([
+        ('threshold', '<f8', (n_nodes,)),
+        ('value', '<f8', (n_nodes,)),
+        ('feature', '<i4', (n_nodes,)),
+        ('left', '<i4', (n_nodes,)),
+        ('right', '<i4', (n_nodes,)),
+        ('root', '<i4', (n_trees,)),
+        ('forest', '<i4', (n_trees,)),
+        ('depth', '<i4', (n_trees,)),
+    ])
+
+    record = np.zeros((), dtype=dtype)
+    record['threshold'] = threshold
+    record['value'] = value
+    record['feature'] = feature
+    record['left'] = left
+    record['right'] = right
+    record['root'] = root
+    record['forest'] = forest
+    record['depth'] = depth
+    return record
+
+def merge_compiled_forests(records):
+    """Combine compiled records into one; trees with the same forest id form a single forest
+
+    Used to add trees fitted on new reviews to existing forests, like
+    sklearn's warm_start, without the original estimators.
+    """
+    fields = {name: [] for name in ('threshold', 'value', 'feature', 'left', 'right', 'root', 'forest', 'depth')}
+    offset = 0
+    for record in records:
+        for name in ('threshold', 'value', 'feature', 'forest', 'depth'):
+            fields[name].append(np.asarray(record[name]))
+        for name in ('left', 'right', 'root'):
+            fields[name].append(np.asarray(record[name]) + offset)
+        offset += len(record['threshold'])
+
+    return _build_record(*(np.concatenate(fields[name]) for name in fields))
+
+def save_compiled_forests(path, forests):
+    """Compile forests and write them to a single .npy file"""
+    np.save(path, compile_forests(forests))
+
+class CompiledForests:
+    """Vectorized evaluator over compiled forests"""
+
+    def __init__(self, record):
+        self.record = record
+        self.threshold = record['threshold']
+        self.value = record['value']
+        self.feature = record['feature']
+        self.left = record['left']
+        self.right = record['right']
+
+        roots = np.asarray(record['root'])
+        forest = np.asarray(record['forest'])
+        depth = np.asarray(record['depth'])
+        self.n_forests = int(forest.max()) + 1 if len(forest) else 0
+        self.roots = [roots[forest == i] for i in range(self.n_forests)]
+        self.max_depth = [int(depth[forest == i].max()) for i in range(self.n_forests)]
+
+    def to_record(self):
+        """The structured record this evaluator was built from, ready for np.save"""
+        return self.record
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Load a compiled forest file, memory-mapped by default"""
+        return cls(np.load(path, mmap_mode=mmap_mode))
+
+    def predict_forest(self, forest_id, X):
+        """Average prediction of one forest for every row of X"""
+        roots = self.roots[forest_id]
+        n_rows = X.shape[0]
+        predictions = np.empty(n_rows)
+
+        for start in range(0, n_rows, PREDICT_BATCH_SIZE):
+            batch = X[start:start + PREDICT_BATCH_SIZE]
+            if hasattr(batch, 'toarray'):
+                batch = batch.toarray()
+            # sklearn compares float32 features against float64 thresholds
+            batch = np.asarray(batch, dtype=np.float32)
+
+            # Index the flattened batch directly to avoid 2-D fancy indexing
+            flat = batch.ravel()
+            row_offsets = (np.arange(batch.shape[0]) * batch.shape[1])[:, None]
+            nodes = np.repeat(roots[None, :], batch.shape[0], axis=0)
+            for _ in range(self.max_depth[forest_id]):
+                go_left = flat[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+                nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+            predictions[start:start + batch.shape[0]] = self.value[nodes].mean(axis=1)
+
+        return predictions
+
+    def predict(self, X):
+        """Predictions of every forest, one row per forest"""
+        if hasattr(X, 'tocsr'):
+            X = X.tocsr()
+        return np.vstack([self.predict_forest(i, X) for i in range(self.n_forests)])
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Local Review Embedding Index
+Embeds reviews with a local sentence-transformers model and answers top-k
+cosine similarity queries in-process, without a network round-trip.
+
+Index layout (default data/embeddings/):
+
+    manifest.json     dimension, dtype, row count, embedding model, IVF settings
+    vectors.bin       row-major L2-normalized vectors, memory-mapped on open
+    metadata.jsonl    one line per row: id, professor, subject, stars, review
+    ivf_centroids.npy optional coarse partition centroids
+    ivf_assign.bin    optional partition of every row (int32)
+
+Appends write the new rows first and then swap the manifest, so readers
+only ever see complete rows. Writers hold an exclusive lock on .lock in the
+index directory, so overlapping syncs append one after the other.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import numpy as np
+from review_stream import iter_reviews, iter_chunks, review_id
+
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'embeddings')
+
+# Rows scored per matrix product; bounds the float32 working copy of float16 vectors
+SEARCH_BLOCK_ROWS = 65536
+# Corpora at least this large use the IVF partition by default when one is built
+IVF_MIN_ROWS = 100000
+DEFAULT_NPROBE = 8
+
+def review_text(review):
+    """Text embedded for a review, matching what /api/uploadreview sends to Pinecone"""
+    return f"{review.get('professor', '')} {review.get('subject', '')} {review.get('review', '')}"
+
+def review_metadata(review):
+    stars = review.get('stars', 0)
+    return {
+        'id': review_id(review),
+        'professor': review.get('professor', ''),
+        'subject': review.get('subject', ''),
+        'stars': int(stars) if isinstance(stars, str) and stars.isdigit() else (stars or 0),
+        'review': review.get('review', ''),
+    }
+
+def normalize_rows(vectors):
+    """L2-normalize rows so dot products are cosine similarities"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class SentenceTransformerEmbedder:
+    """Batch embedder backed by a local sentence-transformers model"""
+
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=64, device=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.device = device
+        self._model = None
+
+    def __call__(self, texts):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device=self.device)
+        vectors = self._model.encode(
+            list(texts), batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False
+        )
+        return normalize_rows(vectors)
+
+def _kmeans(vectors, n_lists, iterations=10, seed=42):
+    """Spherical k-means over normalized vectors; returns normalized centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=n_lists) == 0
+        # Reseed empty lists with random rows so every list stays useful
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+@contextlib.contextmanager
+def index_lock(path):
+    """Exclusive lock held by every process writing to the index at path"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, '.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class EmbeddingIndex:
+    """Memory-mapped vector matrix with an id/metadata sidecar"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(self._file('manifest.json'), 'r') as f:
+            self.manifest = json.load(f)
+        self.dtype = np.dtype(self.manifest['dtype'])
+        self.dim = self.manifest['dim']
+        self._vectors = None
+        self._metadata = None
+        self._ids = None
+        self._centroids = None
+        self._lists = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @classmethod
+    def create(cls, path, dim, dtype='float16', model_name=DEFAULT_EMBEDDING_MODEL):
+        """Create an empty index"""
+        os.makedirs(path, exist_ok=True)
+        for name in ('vectors.bin', 'metadata.jsonl', 'ivf_assign.bin', 'ivf_centroids.npy'):
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+        manifest = {
+            'dim': int(dim),
+            'dtype': np.dtype(dtype).name,
+            'count': 0,
+            'metadata_bytes': 0,
+            'model': model_name,
+            'ivf_lists': 0,
+        }
+        cls._write_manifest(path, manifest)
+        return cls(path)
+
+    @classmethod
+    def open(cls, path=DEFAULT_INDEX_DIR):
+        return cls(path)
+
+    @classmethod
+    def open_or_create(cls, path, dim, dtype='float16', model_name=DEFAULT_EMBEDDING_MODEL):
+        """Open the index at path, creating it unless another writer already has"""
+        with index_lock(path):
+            if os.path.exists(os.path.join(path, 'manifest.json')):
+                return cls(path)
+            return cls.create(path, dim, dtype, model_name)
+
+    def _refresh(self):
+        """Pick up rows appended by other processes since the manifest was read"""
+        with open(self._file('manifest.json'), 'r') as f:
+            manifest = json.load(f)
+        if manifest != self.manifest:
+            self.manifest = manifest
+            self._vectors = None
+            self._metadata = None
+            self._ids = None
+            self._centroids = None
+            self._lists = None
+
+    @staticmethod
+    def _write_manifest(path, manifest):
+        fd, tmp_path = tempfile.mkstemp(prefix='.manifest-', dir=path)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(path, 'manifest.json'))
+
+    def __len__(self):
+        return self.manifest['count']
+
+    @property
+    def vectors(self):
+        """Memory-mapped (count, dim) matrix"""
+        if self._vectors is None:
+            if len(self) == 0:
+                self._vectors = np.zeros((0, self.dim), dtype=self.dtype)
+            else:
+                self._vectors = np.memmap(self._file('vectors.bin'), dtype=self.dtype, mode='r',
+                                          shape=(len(self), self.dim))
+        return self._vectors
+
+    @property
+    def metadata(self):
+        """Metadata dicts in row order"""
+        if self._metadata is None:
+            self._metadata = []
+            if len(self):
+                with open(self._file('metadata.jsonl'), 'r', encoding='utf-8') as f:
+                    for _, line in zip(range(len(self)), f):
+                        self._metadata.append(json.loads(line))
+        return self._metadata
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = {item['id'] for item in self.metadata}
+        return self._ids
+
+    def append(self, vectors, metadata):
+        """Append normalized vectors with their metadata, skipping ids already indexed"""
+        with index_lock(self.path):
+            self._refresh()
+            return self._append(normalize_rows(vectors), metadata)
+
+    def _append(self, vectors, metadata):
+        keep = []
+        seen = set(self.ids)
+        for i, item in enumerate(metadata):
+            if item['id'] not in seen:
+                seen.add(item['id'])
+                keep.append(i)
+        if not keep:
+            return 0
+        vectors = vectors[keep].astype(self.dtype)
+        metadata = [metadata[i] for i in keep]
+
+        row_bytes = self.dim * self.dtype.itemsize
+        count = len(self)
+        # Truncate first so rows left behind by an interrupted append are overwritten
+        with open(self._file('vectors.bin'), 'ab') as f:
+            f.truncate(count * row_bytes)
+            f.write(vectors.tobytes())
+        with open(self._file('metadata.jsonl'), 'ab') as f:
+            f.truncate(self.manifest['metadata_bytes'])
+            for item in metadata:
+                f.write((json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8'))
+            metadata_bytes = f.tell()
+        if self.manifest['ivf_lists']:
+            assign = self._assign(vectors.astype(np.float32)).astype(np.int32)
+            with open(self._file('ivf_assign.bin'), 'ab') as f:
+                f.truncate(count * 4)
+                f.write(assign.tobytes())
+
+        self.manifest['count'] = count + len(keep)
+        self.manifest['metadata_bytes'] = metadata_bytes
+        self._write_manifest(self.path, self.manifest)
+
+        self._vectors = None
+        self._lists = None
+        if self._metadata is not None:
+            self._metadata.extend(metadata)
+        if self._ids is not None:
+            self._ids.update(item['id'] for item in metadata)
+        return len(keep)
+
+    def build_ivf(self, n_lists=None, sample_size=50000, iterations=10):
+        """Partition the rows into n_lists coarse cells for sub-linear search"""
+        with index_lock(self.path):
+            self._refresh()
+            return self._build_ivf(n_lists, sample_size, iterations)
+
+    def _build_ivf(self, n_lists, sample_size, iterations):
+        count = len(self)
+        if count == 0:
+            raise ValueError("Cannot build an IVF partition for an empty index")
+        n_lists = min(count, n_lists or max(1, int(np.sqrt(count))))
+
+        rng = np.random.default_rng(42)
+        sample = np.sort(rng.choice(count, min(count, sample_size), replace=False))
+        self._centroids = _kmeans(np.asarray(self.vectors[sample], dtype=np.float32), n_lists, iterations)
+        np.save(self._file('ivf_centroids.npy'), self._centroids)
+
+        with open(self._file('ivf_assign.bin'), 'wb') as f:
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                f.write(self._assign(block).astype(np.int32).tobytes())
+
+        self.manifest['ivf_lists'] = int(n_lists)
+        self._write_manifest(self.path, self.manifest)
+        self._lists = None
+        return n_lists
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    @property
+    def centroids(self):
+        if self._centroids is None:
+            self._centroids = np.load(self._file('ivf_centroids.npy'))
+        return self._centroids
+
+    def _inverted_lists(self):
+        """Row ids grouped by partition, plus the start offset of every partition"""
+        if self._lists is None:
+            assign = np.fromfile(self._file('ivf_assign.bin'), dtype=np.int32, count=len(self))
+            order = np.argsort(assign, kind='stable')
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.manifest['ivf_lists']))])
+            self._lists = (order, offsets)
+        return self._lists
+
+    def _top_k(self, scores, rows, k):
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(rows[i]) if rows is not None else int(i)) for i in top]
+
+    def search_vector(self, query, k=5, nprobe=None):
+        """Top-k (score, row) pairs by cosine similarity for one query vector"""
+        query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        use_ivf = self.manifest['ivf_lists'] and (nprobe is not None or len(self) >= IVF_MIN_ROWS)
+
+        if use_ivf:
+            order, offsets = self._inverted_lists()
+            nprobe = min(nprobe or DEFAULT_NPROBE, self.manifest['ivf_lists'])
+            probes = np.argsort(-(self.centroids @ query))[:nprobe]
+            rows = np.sort(np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes]))
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+            return self._top_k(scores, rows, k)
+
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        return self._top_k(scores, None, k)
+
+    def search(self, query, embedder, k=5, nprobe=None):
+        """Top-k reviews most similar to a text query, as metadata dicts with a score"""
+        query_vector = embedder([query])[0]
+        results = []
+        for score, row in self.search_vector(query_vector, k, nprobe):
+            item = dict(self.metadata[row])
+            item['score'] = score
+            results.append(item)
+        return results
+
+def index_reviews(index_path, reviews, embedder, batch_size=256, dtype='float16', model_name=None):
+    """Embed reviews in batches and append them to the index, creating it if needed"""
+    index = EmbeddingIndex.open(index_path) if os.path.exists(os.path.join(index_path, 'manifest.json')) else None
+    added = 0
+    for batch in iter_chunks(reviews, batch_size):
+        metadata = [review_metadata(review) for review in batch]
+        if index is not None:
+            # Skip embedding work for reviews that are already indexed
+            new = [i for i, item in enumerate(metadata) if item['id'] not in index.ids]
+            batch = [batch[i] for i in new]
+            metadata = [metadata[i] for i in new]
+            if not batch:
+                continue
+
+        vectors = embedder([review_text(review) for review in batch])
+        if index is None:
+            index = EmbeddingIndex.open_or_create(index_path, vectors.shape[1], dtype,
+                                                  model_name or getattr(embedder, 'model_name', DEFAULT_EMBEDDING_MODEL))
+        added += index.append(vectors, metadata)
+    return index, added
+
+def main():
+    parser = argparse.ArgumentParser(description='Local embedding index for review similarity search')
+    parser.add_argument('--index', default=DEFAULT_INDEX_DIR, help='Index directory')
+    parser.add_argument('--model', default=DEFAULT_EMBEDDING_MODEL, help='sentence-transformers model name')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = subparsers.add_parser('sync', help='Embed reviews that are not indexed yet')
+    sync_parser.add_argument('--data', default='data/reviews.json')
+    sync_parser.add_argument('--batch-size', type=int, default=256)
+    sync_parser.add_argument('--dtype', choices=['float16', 'float32'], default='float16')
+
+    ivf_parser = subparsers.add_parser('build-ivf', help='Build the coarse IVF partition')
+    ivf_parser.add_argument('--lists', type=int, help='Number of partitions (default sqrt(rows))')
+
+    query_parser = subparsers.add_parser('query', help='Find the reviews most similar to a text')
+    query_parser.add_argument('text')
+    query_parser.add_argument('-k', type=int, default=5)
+    query_parser.add_argument('--nprobe', type=int, help='Partitions searched when an IVF partition exists')
+    args = parser.parse_args()
+
+    if args.command == 'sync':
+        embedder = SentenceTransformerEmbedder(args.model)
+        index, added = index_reviews(args.index, iter_reviews(args.data), embedder, args.batch_size, args.dtype)
+        print(f"Added {added} reviews, {len(index) if index else 0} indexed")
+    elif args.command == 'build-ivf':
+        n_lists = EmbeddingIndex.open(args.index).build_ivf(args.lists)
+        print(f"Built IVF partition with {n_lists} lists")
+    elif args.command == 'query':
+        index = EmbeddingIndex.open(args.index)
+        embedder = SentenceTransformerEmbedder(index.manifest['model'])
+        print(json.dumps(index.search(args.text, embedder, args.k, args.nprobe), indent=2))
+
+if __name__ == "__main__":
+    main()
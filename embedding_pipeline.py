@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Bulk Review Embedding Pipeline
+Streams reviews, embeds them in batches with several requests in flight and
+upserts the vectors in bounded chunks, replacing the one-request-per-review
+loop of load.ipynb.
+
+    python3 embedding_pipeline.py --embedder huggingface --store pinecone
+    python3 embedding_pipeline.py --embedder fake --embed-latency-ms 80 --store memory --synthetic 100000
+
+Vector ids are review ids (review_stream.review_id), so reviews of one
+professor no longer overwrite each other and re-running the pipeline
+overwrites vectors instead of duplicating them. After every upserted chunk
+the position in the review file is checkpointed: an interrupted run resumes
+after the last stored review, and a finished run only processes reviews
+appended since.
+
+Embedders and stores are small classes with one coroutine each, embed(texts)
+and upsert(ids, vectors, metadata); the fake ones run in-process so the
+pipeline can be benchmarked offline.
+"""
+
+import argparse
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import numpy as np
+from embedding_index import (DEFAULT_INDEX_DIR, EmbeddingIndex, SentenceTransformerEmbedder,
+                             normalize_rows, review_metadata, review_text)
+from instrumentation import Instrumentation
+from review_stream import iter_appended, iter_chunks, review_id
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data',
+                                  'embedding_pipeline.checkpoint.json')
+
+# The index and embedding model /api/chat queries
+PINECONE_INDEX = 'professors-index'
+PINECONE_NAMESPACE = 'ns1'
+HUGGINGFACE_MODEL = 'intfloat/multilingual-e5-large'
+OPENAI_MODEL = 'text-embedding-3-small'
+
+class FakeEmbedder:
+    """Deterministic pseudo-embeddings with simulated latency and failures"""
+
+    def __init__(self, dim=1024, latency=0.0, failure_rate=0.0, seed=0):
+        self.name = f'fake-{dim}'
+        self.dim = dim
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+
+    async def embed(self, texts):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise ConnectionError("Simulated embedding failure")
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+            vectors[row] = np.random.default_rng(seed).standard_normal(self.dim)
+        return normalize_rows(vectors)
+
+class HuggingFaceEmbedder:
+    """Hosted inference API, the embeddings /api/chat and /api/uploadreview use"""
+
+    def __init__(self, token, model=HUGGINGFACE_MODEL, timeout=60.0):
+        self.name = model
+        self.token = token
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, model=HUGGINGFACE_MODEL):
+        """Embedder authenticated with HUGGINGFACE_API_TOKEN"""
+        token = os.environ.get('HUGGINGFACE_API_TOKEN')
+        if not token:
+            raise ValueError("HUGGINGFACE_API_TOKEN is not set")
+        return cls(token, model)
+
+    async def embed(self, texts):
+        return await asyncio.to_thread(self._request, list(texts))
+
+    def _request(self, texts):
+        import urllib.request
+        request = urllib.request.Request(
+            f'https://api-inference.huggingface.co/models/{self.name}',
+            data=json.dumps({'inputs': texts}).encode('utf-8'),
+            headers={'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.load(response)
+        # Depending on the model the API answers with bare vectors or {"embedding": [...]} objects
+        return normalize_rows([item['embedding'] if isinstance(item, dict) else item for item in data])
+
+class OpenAIEmbedder:
+    """OpenAI embeddings API, as used by load.ipynb"""
+
+    def __init__(self, model=OPENAI_MODEL, dimensions=None):
+        self.name = model
+        self.dimensions = dimensions
+        self._client = None
+
+    async def embed(self, texts):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI()
+        options = {'dimensions': self.dimensions} if self.dimensions else {}
+        response = await self._client.embeddings.create(input=list(texts), model=self.name, **options)
+        return normalize_rows([item.embedding for item in sorted(response.data, key=lambda item: item.index)])
+
+class LocalEmbedder:
+    """Local sentence-transformers model, run on a worker thread one batch at a time"""
+
+    def __init__(self, model_name):
+        self.name = model_name
+        self._embedder = SentenceTransformerEmbedder(model_name)
+        self._lock = threading.Lock()
+
+    async def embed(self, texts):
+        return await asyncio.to_thread(self._embed, list(texts))
+
+    def _embed(self, texts):
+        # The model already uses every core; concurrent batches would only contend
+        with self._lock:
+            return self._embedder(texts)
+
+class MemoryVectorStore:
+    """In-process vector store with simulated latency"""
+
+    def __init__(self, latency=0.0):
+        self.name = 'memory'
+        self.latency = latency
+        self.vectors = {}
+        self.metadata = {}
+
+    def __len__(self):
+        return len(self.vectors)
+
+    async def upsert(self, ids, vectors, metadata):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for vector_id, vector, item in zip(ids, vectors, metadata):
+            self.vectors[vector_id] = vector
+            self.metadata[vector_id] = item
+
+class LocalIndexStore:
+    """The memory-mapped EmbeddingIndex of embedding_index.py, created on the first upsert"""
+
+    def __init__(self, path=DEFAULT_INDEX_DIR, model_name=None, dtype='float16'):
+        self.name = f'local:{path}'
+        self.path = path
+        self.model_name = model_name
+        self.dtype = dtype
+        self._index = None
+
+    async def upsert(self, ids, vectors, metadata):
+        await asyncio.to_thread(self._append, vectors, metadata)
+
+    def _append(self, vectors, metadata):
+        if self._index is None:
+            self._index = EmbeddingIndex.open_or_create(self.path, vectors.shape[1], self.dtype, self.model_name)
+        # Reviews already in the index are skipped, so resumed runs never add rows twice
+        self._index.append(vectors, metadata)
+
+class PineconeStore:
+    """Pinecone index, created with the dimension of the first upserted vectors if missing"""
+
+    def __init__(self, api_key, index_name=PINECONE_INDEX, namespace=PINECONE_NAMESPACE):
+        self.name = f'pinecone:{index_name}/{namespace}'
+        self.api_key = api_key
+        self.index_name = index_name
+        self.namespace = namespace
+        self._index = None
+
+    @classmethod
+    def from_env(cls):
+        """Store authenticated with PINECONE_API_KEY"""
+        api_key = os.environ.get('PINECONE_API_KEY')
+        if not api_key:
+            raise ValueError("PINECONE_API_KEY is not set")
+        return cls(api_key)
+
+    async def upsert(self, ids, vectors, metadata):
+        await asyncio.to_thread(self._upsert, ids, vectors, metadata)
+
+    def _upsert(self, ids, vectors, metadata):
+        if self._index is None:
+            from pinecone import Pinecone, ServerlessSpec
+            client = Pinecone(api_key=self.api_key)
+            if self.index_name not in client.list_indexes().names():
+                client.create_index(name=self.index_name, dimension=vectors.shape[1], metric='cosine',
+                                    spec=ServerlessSpec(cloud='aws', region='us-east-1'))
+            self._index = client.Index(self.index_name)
+        # Pinecone rejects null metadata values; the id is the vector id already
+        self._index.upsert(vectors=[
+            {'id': vector_id, 'values': vector.tolist(),
+             'metadata': {key: value for key, value in item.items() if key != 'id' and value is not None}}
+            for vector_id, vector, item in zip(ids, vectors, metadata)
+        ], namespace=self.namespace)
+
+class Checkpoint:
+    """Position in a review file up to which every review is stored"""
+
+    def __init__(self, path, data_path, target):
+        self.path = path
+        self.data_path = os.path.abspath(data_path)
+        self.target = target
+
+    def load(self):
+        """(position, last review id, upserted) to resume from; raises ValueError for another run's checkpoint"""
+        if not os.path.exists(self.path):
+            return 0, None, 0
+        with open(self.path, 'r') as f:
+            state = json.load(f)
+        if state['data'] != self.data_path or state['target'] != self.target:
+            raise ValueError(f"{self.path} belongs to a run of {state['data']} into {state['target']}; "
+                             f"use --restart or another --checkpoint")
+        return state['position'], state['last_review_id'], state['upserted']
+
+    def save(self, position, last_review_id, upserted):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.checkpoint-', dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'data': self.data_path, 'target': self.target, 'position': position,
+                       'last_review_id': last_review_id, 'upserted': upserted,
+                       'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class EmbeddingPipeline:
+    """Concurrent batched embedding with retries and chunked, checkpointed upserts
+
+    At most `concurrency` embedding requests run at once and at most twice
+    that many batches are held in memory. Results are consumed in input
+    order, so the checkpoint always covers a contiguous prefix of the file.
+    """
+
+    def __init__(self, embedder, store, batch_size=64, concurrency=8, upsert_chunk_size=200,
+                 max_attempts=5, base_delay=0.5, max_delay=30.0):
+        self.embedder = embedder
+        self.store = store
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.upsert_chunk_size = upsert_chunk_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.instrumentation = Instrumentation()
+
+    async def _with_retries(self, name, call):
+        """Await call(), retrying failures with capped exponential backoff and jitter"""
+        for attempt in range(self.max_attempts):
+            try:
+                return await call()
+            except Exception as e:
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.instrumentation.count(f'{name}_retries')
+                print(f"{name} failed ({e!r}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _embed(self, semaphore, texts):
+        async with semaphore:
+            start = time.perf_counter()
+            vectors = await self._with_retries('embed', lambda: self.embedder.embed(texts))
+            self.instrumentation.add_time('embed', time.perf_counter() - start)
+            return vectors
+
+    async def run(self, reviews, start=0, checkpoint=None, upserted=0):
+        """Embed and upsert reviews, an iterable starting at position `start` of the data file
+
+        Reviews without text are skipped. Returns run statistics.
+        """
+        instrumentation = self.instrumentation
+        instrumentation.reset()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = collections.deque()
+        # (position, id, vector, metadata) of embedded reviews waiting for an upsert
+        buffer = []
+        state = {'position': start, 'upserted': upserted}
+        last_read = None
+        began = time.perf_counter()
+
+        async def flush(count):
+            chunk = buffer[:count]
+            del buffer[:count]
+            started = time.perf_counter()
+            await self._with_retries('upsert', lambda: self.store.upsert(
+                [item[1] for item in chunk], np.stack([item[2] for item in chunk]), [item[3] for item in chunk]
+            ))
+            instrumentation.add_time('upsert', time.perf_counter() - started)
+            instrumentation.count('upserted', len(chunk))
+            state['upserted'] += len(chunk)
+            # Results arrive in input order, so everything up to the last flushed review is stored
+            position, last_review_id = chunk[-1][0], chunk[-1][1]
+            state['position'] = position + 1
+            if checkpoint is not None:
+                checkpoint.save(position + 1, last_review_id, state['upserted'])
+
+        async def collect(positions, batch, task):
+            vectors = await task
+            for position, review, vector in zip(positions, batch, vectors):
+                metadata = review_metadata(review)
+                buffer.append((position, metadata['id'], vector, metadata))
+            while len(buffer) >= self.upsert_chunk_size:
+                await flush(self.upsert_chunk_size)
+
+        try:
+            for batch in iter_chunks(enumerate(reviews, start), self.batch_size):
+                instrumentation.count('reviews', len(batch))
+                last_read = (batch[-1][0] + 1, review_id(batch[-1][1]))
+                embeddable = [(position, review) for position, review in batch if review.get('review')]
+                instrumentation.count('skipped', len(batch) - len(embeddable))
+                if not embeddable:
+                    continue
+                positions, batch = [position for position, _ in embeddable], [review for _, review in embeddable]
+                task = asyncio.create_task(self._embed(semaphore, [review_text(review) for review in batch]))
+                pending.append((positions, batch, task))
+                instrumentation.count('batches')
+                if len(pending) >= 2 * self.concurrency:
+                    await collect(*pending.popleft())
+            while pending:
+                await collect(*pending.popleft())
+            if buffer:
+                await flush(len(buffer))
+            # Also move past trailing reviews without text
+            if last_read is not None:
+                state['position'] = last_read[0]
+                if checkpoint is not None:
+                    checkpoint.save(last_read[0], last_read[1], state['upserted'])
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+        elapsed = time.perf_counter() - began
+        stats = instrumentation.snapshot()
+        reviews = stats['counters'].get('reviews', 0)
+        stats.update(elapsed_seconds=round(elapsed, 3),
+                     reviews_per_second=round(reviews / elapsed, 1) if elapsed > 0 else None,
+                     position=state['position'], upserted_total=state['upserted'])
+        return stats
+
+def run_pipeline(pipeline, data_path, checkpoint_path=DEFAULT_CHECKPOINT, restart=False, limit=None):
+    """Run the pipeline over data_path, resuming from its checkpoint unless restart=True"""
+    checkpoint = None
+    position, last_review_id, upserted = 0, None, 0
+    if checkpoint_path:
+        checkpoint = Checkpoint(checkpoint_path, data_path, f'{pipeline.embedder.name} -> {pipeline.store.name}')
+        if restart:
+            checkpoint.clear()
+        position, last_review_id, upserted = checkpoint.load()
+    if position:
+        print(f"Resuming after review {position} of {data_path}")
+    reviews = iter_appended(data_path, position, last_review_id)
+    if limit is not None:
+        reviews = itertools.islice(reviews, limit)
+    return asyncio.run(pipeline.run(reviews, position, checkpoint, upserted))
+
+def main():
+    parser = argparse.ArgumentParser(description='Embed reviews concurrently and upsert them into a vector store')
+    parser.add_argument('--data', default='data/reviews.json', help='Reviews as {"reviews": [...]} JSON or JSON Lines')
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help='Use N generated reviews instead of --data (no checkpoint), for benchmarks')
+    parser.add_argument('--embedder', choices=['huggingface', 'openai', 'local', 'fake'], default='huggingface')
+    parser.add_argument('--model', help='Embedding model (defaults depend on --embedder)')
+    parser.add_argument('--dimensions', type=int, help='Output dimensions for OpenAI text-embedding-3 models')
+    parser.add_argument('--store', choices=['pinecone', 'local', 'memory'], default='pinecone')
+    parser.add_argument('--index', default=DEFAULT_INDEX_DIR, help='Index directory for --store local')
+    parser.add_argument('--batch-size', type=int, default=64, help='Reviews per embedding request')
+    parser.add_argument('--concurrency', type=int, default=8, help='Embedding requests in flight')
+    parser.add_argument('--upsert-chunk-size', type=int, default=200, help='Vectors per upsert call')
+    parser.add_argument('--max-attempts', type=int, default=5, help='Attempts per request before giving up')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the first review')
+    parser.add_argument('--limit', type=int, help='Stop after this many reviews')
+    parser.add_argument('--embed-latency-ms', type=float, default=0.0, help='Simulated latency of --embedder fake')
+    parser.add_argument('--upsert-latency-ms', type=float, default=0.0, help='Simulated latency of --store memory')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of failing --embedder fake requests')
+    args = parser.parse_args()
+
+    if args.embedder == 'huggingface':
+        embedder = HuggingFaceEmbedder.from_env(args.model or HUGGINGFACE_MODEL)
+    elif args.embedder == 'openai':
+        embedder = OpenAIEmbedder(args.model or OPENAI_MODEL, args.dimensions)
+    elif args.embedder == 'local':
+        embedder = LocalEmbedder(args.model or HUGGINGFACE_MODEL)
+    else:
+        embedder = FakeEmbedder(args.dimensions or 1024, args.embed_latency_ms / 1000.0, args.failure_rate)
+
+    if args.store == 'pinecone':
+        store = PineconeStore.from_env()
+    elif args.store == 'local':
+        store = LocalIndexStore(args.index, embedder.name)
+    else:
+        store = MemoryVectorStore(args.upsert_latency_ms / 1000.0)
+
+    pipeline = EmbeddingPipeline(embedder, store, args.batch_size, args.concurrency, args.upsert_chunk_size,
+                                 args.max_attempts)
+    if args.synthetic:
+        from benchmark import generate_reviews
+        stats = asyncio.run(pipeline.run(generate_reviews(args.synthetic)))
+    else:
+        stats = run_pipeline(pipeline, args.data, args.checkpoint, args.restart, args.limit)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Per-Review Feature Cache
+Persistent, content-addressed store of preprocessed review text and the
+length/word count features, so retraining only pays preprocessing cost for
+new or edited reviews.
+
+Entries are keyed by a hash of the review text and the preprocessor
+signature (stopword list / NLTK fallback mode), so a change in
+preprocessing never serves stale tokens.
+"""
+
+import argparse
+import hashlib
+import sqlite3
+import time
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+class FeatureCache:
+    """SQLite-backed store of preprocessed reviews keyed by content hash"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, timeout=30.0)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS review_features ('
+            'key BLOB PRIMARY KEY, processed TEXT, review_length INTEGER, '
+            'word_count INTEGER, last_used REAL)'
+        )
+        self._db.commit()
+        self.stats = {'cached': 0, 'recomputed': 0, 'uncacheable': 0}
+        # Keys preprocessed by this instance but not counted yet; the first read counts as recomputed
+        self._computed = set()
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def _key(namespace, text):
+        return hashlib.sha256(f"{namespace}\0{text}".encode('utf-8')).digest()
+
+    def _lookup(self, keys):
+        found = {}
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._db.execute(
+                f'SELECT key, processed, review_length, word_count FROM review_features WHERE key IN ({placeholders})',
+                batch
+            )
+            for key, processed, review_length, word_count in rows:
+                found[key] = (processed, review_length, word_count)
+        return found
+
+    def featurize(self, texts, preprocessor, count=True):
+        """Preprocessed text, review lengths and word counts for every text
+
+        Returns the same values as preprocess_many plus the pandas
+        str.len()/str.split().str.len() features (0 for non-strings).
+        With count=False the rows are left out of self.stats, so a later
+        counted read of a review preprocessed here still reports it as
+        recomputed.
+        """
+        texts = list(texts)
+        namespace = preprocessor.signature()
+        now = time.time()
+
+        keys = [self._key(namespace, text) if isinstance(text, str) else None for text in texts]
+        unique_keys = list({key for key in keys if key is not None})
+        found = self._lookup(unique_keys)
+
+        # Preprocess each missing review once, even if it appears several times
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key is not None and key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            processed = preprocessor.preprocess_many(list(missing.values()))
+            rows = []
+            for (key, text), tokens in zip(missing.items(), processed):
+                found[key] = (tokens, len(text), len(text.split()))
+                self._computed.add(key)
+                rows.append((key, tokens, len(text), len(text.split()), now))
+            self._db.executemany(
+                'INSERT OR REPLACE INTO review_features '
+                '(key, processed, review_length, word_count, last_used) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+
+        # Mark cache hits as used so compaction keeps them
+        hits = [key for key in unique_keys if key not in missing]
+        self._db.executemany('UPDATE review_features SET last_used = ? WHERE key = ?', [(now, key) for key in hits])
+        self._db.commit()
+
+        processed_reviews, review_length, word_count = [], [], []
+        for key, text in zip(keys, texts):
+            if key is None:
+                processed_reviews.append(preprocessor.preprocess(text))
+                review_length.append(0)
+                word_count.append(0)
+                if count:
+                    self.stats['uncacheable'] += 1
+                continue
+            tokens, length, words = found[key]
+            processed_reviews.append(tokens)
+            review_length.append(length)
+            word_count.append(words)
+            if not count:
+                continue
+            if key in self._computed:
+                self._computed.discard(key)
+                self.stats['recomputed'] += 1
+            else:
+                self.stats['cached'] += 1
+
+        return processed_reviews, review_length, word_count
+
+    def compact(self, max_age_days=30):
+        """Drop entries not used for max_age_days and reclaim the space"""
+        cutoff = time.time() - max_age_days * 86400
+        cursor = self._db.execute('DELETE FROM review_features WHERE last_used < ?', (cutoff,))
+        removed = cursor.rowcount
+        self._db.commit()
+        self._db.execute('VACUUM')
+        return removed
+
+    def size(self):
+        return self._db.execute('SELECT COUNT(*) FROM review_features').fetchone()[0]
+
+def main():
+    import os
+    from model_bundle import DEFAULT_MODEL_DIR
+
+    parser = argparse.ArgumentParser(description='Inspect and compact the per-review feature cache')
+    parser.add_argument('--db', default=os.path.join(DEFAULT_MODEL_DIR, 'feature_cache.sqlite'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help='Show the number of cached reviews')
+    compact_parser = subparsers.add_parser('compact', help='Drop entries unused for a while')
+    compact_parser.add_argument('--max-age-days', type=float, default=30)
+    args = parser.parse_args()
+
+    cache = FeatureCache(args.db)
+    if args.command == 'stats':
+        print(f"{cache.size()} cached reviews in {args.db}")
+    elif args.command == 'compact':
+        removed = cache.compact(args.max_age_days)
+        print(f"Removed {removed} entries, {cache.size()} cached reviews remain")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
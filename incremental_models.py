@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Incremental Models
+Regressors that can be trained chunk by chunk with partial_fit. They live in
+their own module so pickled models load the same way whether training ran
+as a script or was imported.
+"""
+
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+
+class IncrementalRegressor:
+    """SGD regressor on max-abs scaled features with a centered target, trainable chunk by chunk"""
+    
+    def __init__(self, scaler, target_mean=0.0, random_state=42):
+        self.scaler = scaler
+        self.target_mean = target_mean
+        self.sgd = SGDRegressor(random_state=random_state)
+    
+    def partial_fit(self, X, y):
+        self.sgd.partial_fit(self.scaler.transform(X), np.asarray(y) - self.target_mean)
+        return self
+    
+    def predict(self, X):
+        return self.sgd.predict(self.scaler.transform(X)) + self.target_mean
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Pipeline Instrumentation
+Cheap per-stage timers and counters for the training and prediction hot
+paths, plus an opt-in sampling profiler that writes a profile for every
+request slower than a threshold.
+
+Stage timers cost two perf_counter() calls, so they stay on all the time;
+prediction responses include them when the request sets "debug": true or
+PREDICTION_DEBUG=1. Profiles are written in the collapsed-stack format
+read by flamegraph.pl and speedscope.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+class Instrumentation:
+    """Accumulated stage timings, counters and gauges"""
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def reset(self):
+        self.timings.clear()
+        self.counters.clear()
+        self.gauges.clear()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Add the wall-clock time of the block to the named stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """JSON-serializable copy, timings in milliseconds"""
+        return {
+            'timings_ms': {name: round(seconds * 1000.0, 3) for name, seconds in self.timings.items()},
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+        }
+
+def debug_enabled(input_data):
+    """Whether a prediction request asked for instrumentation in its response"""
+    return bool(input_data.get('debug')) or os.environ.get('PREDICTION_DEBUG', '') not in ('', '0')
+
+class _Sampler(threading.Thread):
+    """Samples the stack of one thread at a fixed interval"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+class RequestProfiler:
+    """Samples request handling and keeps a profile only for slow requests"""
+
+    def __init__(self, profile_dir=None, threshold_ms=1000.0, interval_ms=5.0):
+        self.profile_dir = profile_dir
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.profiles_written = 0
+
+    @classmethod
+    def from_env(cls):
+        """Profiler configured by PREDICTION_PROFILE_DIR, _THRESHOLD_MS and _INTERVAL_MS"""
+        return cls(
+            profile_dir=os.environ.get('PREDICTION_PROFILE_DIR') or None,
+            threshold_ms=float(os.environ.get('PREDICTION_PROFILE_THRESHOLD_MS', 1000.0)),
+            interval_ms=float(os.environ.get('PREDICTION_PROFILE_INTERVAL_MS', 5.0))
+        )
+
+    @property
+    def enabled(self):
+        return self.profile_dir is not None
+
+    @contextlib.contextmanager
+    def profile(self, label='request'):
+        """Sample the calling thread for the duration of the block"""
+        if not self.enabled:
+            yield
+            return
+
+        sampler = _Sampler(threading.get_ident(), self.interval_ms / 1000.0)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            # Requests shorter than one sampling interval have nothing to show
+            if elapsed_ms >= self.threshold_ms and sampler.stacks:
+                self._write(label, elapsed_ms, sampler.stacks)
+
+    def _write(self, label, elapsed_ms, stacks):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{label}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.profiles_written}-{elapsed_ms:.0f}ms.folded"
+        with open(os.path.join(self.profile_dir, name), 'w') as f:
+            for stack, samples in stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+        self.profiles_written += 1
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Versioned Model Bundles
+Stores everything prediction needs in a single immutable, versioned directory:
+
+    models/
+      CURRENT                 name of the published version
+      bundles/v0003/
+        manifest.json         version, training metrics, feature schema, checksums
+        forests.npy           compiled rating/difficulty forests (see compiled_forest.py)
+        vocabulary.npy        TF-IDF terms ordered by column
+        idf.npy               TF-IDF idf vector
+        subjects.npy          subject encoder classes
+        stopwords.npy         stopword list used by text preprocessing
+
+Bundles are written to a temporary directory and renamed into place, then
+CURRENT is swapped atomically, so readers never see a half-written set of
+models. Arrays are memory-mapped on load, and older versions are kept so an
+operator can roll back by pointing CURRENT at them again.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from compiled_forest import CompiledForests, compile_forests
+
+# Trained models live next to this file unless PROFESSOR_MODEL_DIR says otherwise
+DEFAULT_MODEL_DIR = os.environ.get(
+    'PROFESSOR_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+)
+
+BUNDLE_FORMAT = 'professor-model-bundle'
+BUNDLE_FORMAT_VERSION = 1
+KEEP_VERSIONS = 5
+
+EXTRA_FEATURES = ['subject', 'review_length', 'word_count']
+
+class CurrentVersionChanged(Exception):
+    """Another version became current while a bundle based on the previous one was built"""
+
+@contextlib.contextmanager
+def _publish_lock(root):
+    """Exclusive lock held while claiming a version number and switching CURRENT"""
+    with open(os.path.join(root, '.publish.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _bundles_dir(root):
+    return os.path.join(root, 'bundles')
+
+def _version_number(version):
+    return int(version.lstrip('v'))
+
+def _file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _json_params(estimator):
+    """The JSON-serializable constructor parameters of an sklearn estimator"""
+    params = {}
+    for key, value in estimator.get_params().items():
+        if isinstance(value, tuple):
+            value = list(value)
+        if value is None or isinstance(value, (str, int, float, bool, list)):
+            params[key] = value
+    return params
+
+def list_versions(root):
+    """Published bundle versions, oldest first"""
+    try:
+        names = os.listdir(_bundles_dir(root))
+    except FileNotFoundError:
+        return []
+    versions = [name for name in names if name.startswith('v') and name[1:].isdigit()]
+    return sorted(versions, key=_version_number)
+
+def current_version(root):
+    """Version CURRENT points at, or None if nothing was published"""
+    try:
+        with open(os.path.join(root, 'CURRENT'), 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def set_current(root, version):
+    """Atomically point CURRENT at a published version"""
+    if not os.path.isdir(os.path.join(_bundles_dir(root), version)):
+        raise ValueError(f"Unknown model bundle version: {version}")
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.CURRENT-', dir=root)
+    with os.fdopen(fd, 'w') as f:
+        f.write(version + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, 'CURRENT'))
+
+def rollback(root, version=None):
+    """Point CURRENT at the given version, or the one before the current version"""
+    with _publish_lock(root):
+        if version is None:
+            versions = list_versions(root)
+            current = current_version(root)
+            older = [v for v in versions if current is None or _version_number(v) < _version_number(current)]
+            if not older:
+                raise ValueError("No older model bundle to roll back to")
+            version = older[-1]
+        set_current(root, version)
+    return version
+
+def prune(root, keep=KEEP_VERSIONS):
+    """Delete the oldest bundles beyond `keep`, never touching the current one"""
+    current = current_version(root)
+    versions = list_versions(root)
+    for version in versions[:max(0, len(versions) - keep)]:
+        if version != current:
+            shutil.rmtree(os.path.join(_bundles_dir(root), version), ignore_errors=True)
+
+def _write_bundle_files(path, model):
+    """Write the model arrays into `path` and describe them for the manifest"""
+    info = {}
+
+    # Vectorizer: fitted TF-IDF vocabulary as raw arrays, stateless ones as parameters
+    vectorizer = model.vectorizer
+    if hasattr(vectorizer, 'vocabulary_'):
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        np.save(os.path.join(path, 'vocabulary.npy'), np.array(terms, dtype=str))
+        np.save(os.path.join(path, 'idf.npy'), np.asarray(vectorizer.idf_, dtype=np.float64))
+        info['vectorizer'] = {'kind': 'tfidf', 'params': _json_params(vectorizer)}
+        n_text_features = len(terms)
+    else:
+        info['vectorizer'] = {'kind': 'hashing', 'params': _json_params(vectorizer)}
+        n_text_features = vectorizer.n_features
+
+    # Subject encoder classes
+    subjects = np.asarray(model.subject_encoder.classes_, dtype=str)
+    np.save(os.path.join(path, 'subjects.npy'), subjects)
+
+    # Text preprocessing resources, so prediction never needs NLTK data
+    preprocessor = model.text_preprocessor
+    info['preprocessing'] = {'mode': preprocessor.mode, 'signature': preprocessor.signature()}
+    if preprocessor.mode == 'stem':
+        np.save(os.path.join(path, 'stopwords.npy'), np.array(sorted(preprocessor.stop_words), dtype=str))
+
+    # Estimators: compiled forests when possible, otherwise a pickle
+    estimators = [model.rating_model, model.difficulty_model]
+    if model.compiled_forests is None and all(hasattr(e, 'estimators_') for e in estimators):
+        np.save(os.path.join(path, 'forests.npy'), compile_forests(estimators))
+        info['estimator'] = 'compiled_forest'
+    elif model.compiled_forests is not None:
+        np.save(os.path.join(path, 'forests.npy'), model.compiled_forests.to_record())
+        info['estimator'] = 'compiled_forest'
+    else:
+        import joblib
+        joblib.dump(estimators, os.path.join(path, 'estimators.pkl'))
+        info['estimator'] = 'pickle'
+
+    info['feature_schema'] = {
+        'text_features': int(n_text_features),
+        'extra_features': EXTRA_FEATURES,
+        'n_features': int(n_text_features) + len(EXTRA_FEATURES),
+        'n_subjects': int(len(subjects)),
+    }
+    return info
+
+def publish_bundle(model, root, metrics=None, training_info=None, keep=KEEP_VERSIONS, base_version=None):
+    """Write the model as a new bundle version and make it current
+
+    With base_version, the bundle is only published while CURRENT still
+    points at base_version; otherwise CurrentVersionChanged is raised and
+    nothing is published.
+    """
+    bundles_dir = _bundles_dir(root)
+    os.makedirs(bundles_dir, exist_ok=True)
+
+    tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=bundles_dir)
+    try:
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'format_version': BUNDLE_FORMAT_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'metrics': {k: float(v) for k, v in (metrics or {}).items()},
+            'training': training_info or {},
+        }
+        manifest.update(_write_bundle_files(tmp_path, model))
+        manifest['files'] = {
+            name: _file_checksum(os.path.join(tmp_path, name)) for name in sorted(os.listdir(tmp_path))
+        }
+
+        with _publish_lock(root):
+            current = current_version(root)
+            if base_version is not None and current != base_version:
+                raise CurrentVersionChanged(f"Current version changed from {base_version} to {current}")
+
+            # Claim the next version number; retry if a concurrent publisher got there first
+            while True:
+                versions = list_versions(root)
+                version = 'v%04d' % (_version_number(versions[-1]) + 1 if versions else 1)
+                manifest['version'] = version
+                with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+                    json.dump(manifest, f, indent=2)
+                try:
+                    os.rename(tmp_path, os.path.join(bundles_dir, version))
+                    break
+                except OSError:
+                    if not os.path.isdir(os.path.join(bundles_dir, version)):
+                        raise
+            set_current(root, version)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    prune(root, keep)
+    return version
+
+def verify_bundle(root, version=None):
+    """Check every file of a bundle against its manifest checksum"""
+    version = version or current_version(root)
+    path = os.path.join(_bundles_dir(root), version)
+    with open(os.path.join(path, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+
+    return {name: _file_checksum(os.path.join(path, name)) == checksum
+            for name, checksum in manifest['files'].items()}
+
+class ModelBundle:
+    """A loaded bundle: manifest plus memory-mapped arrays"""
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self.version = manifest['version']
+
+    def load_array(self, name):
+        return np.load(os.path.join(self.path, name), mmap_mode='r')
+
+    def build_vectorizer(self):
+        """Recreate the text vectorizer from the stored arrays"""
+        spec = self.manifest['vectorizer']
+        params = dict(spec['params'])
+        if 'ngram_range' in params:
+            params['ngram_range'] = tuple(params['ngram_range'])
+
+        if spec['kind'] == 'tfidf':
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            vectorizer = TfidfVectorizer(**params)
+            terms = self.load_array('vocabulary.npy')
+            vectorizer.vocabulary_ = {str(term): i for i, term in enumerate(terms)}
+            vectorizer.idf_ = np.asarray(self.load_array('idf.npy'))
+            return vectorizer
+
+        from sklearn.feature_extraction.text import HashingVectorizer
+        return HashingVectorizer(**params)
+
+    def build_text_preprocessor(self):
+        """Text preprocessor matching training, or None for bundles that predate stored resources"""
+        from text_preprocessing import TextPreprocessor
+        spec = self.manifest.get('preprocessing')
+        if spec is None:
+            return None
+        if spec['mode'] == 'fallback':
+            return TextPreprocessor(fallback=True)
+        return TextPreprocessor(stop_words=[str(word) for word in self.load_array('stopwords.npy')])
+
+    def build_subject_encoder(self):
+        """Recreate the subject encoder from the stored classes"""
+        from sklearn.preprocessing import LabelEncoder
+        encoder = LabelEncoder()
+        encoder.classes_ = np.asarray(self.load_array('subjects.npy'))
+        return encoder
+
+    def load_estimators(self):
+        """Compiled forests, or the pickled (rating, difficulty) models"""
+        if self.manifest['estimator'] == 'compiled_forest':
+            return CompiledForests.load(os.path.join(self.path, 'forests.npy'))
+        import joblib
+        return joblib.load(os.path.join(self.path, 'estimators.pkl'))
+
+def load_bundle(root, version=None):
+    """Load the current (or given) bundle version"""
+    version = version or current_version(root)
+    if version is None:
+        raise FileNotFoundError(f"No model bundle published in {root}")
+
+    path = os.path.join(_bundles_dir(root), version)
+    with open(os.path.join(path, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format') != BUNDLE_FORMAT or manifest.get('format_version', 0) > BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model bundle format in {path}")
+    return ModelBundle(path, manifest)
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect, verify and roll back model bundles')
+    parser.add_argument('--models-dir', default=DEFAULT_MODEL_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='List published versions')
+    verify_parser = subparsers.add_parser('verify', help='Check bundle checksums')
+    verify_parser.add_argument('version', nargs='?')
+    rollback_parser = subparsers.add_parser('rollback', help='Make an older version current')
+    rollback_parser.add_argument('version', nargs='?')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        current = current_version(args.models_dir)
+        for version in list_versions(args.models_dir):
+            manifest = load_bundle(args.models_dir, version).manifest
+            marker = '*' if version == current else ' '
+            metrics = ', '.join(f"{k}={v:.3f}" for k, v in manifest['metrics'].items())
+            print(f"{marker} {version}  {manifest['created_at']}  {metrics}")
+    elif args.command == 'verify':
+        results = verify_bundle(args.models_dir, args.version)
+        for name, ok in results.items():
+            print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        if not all(results.values()):
+            raise SystemExit(1)
+    elif args.command == 'rollback':
+        print(f"CURRENT -> {rollback(args.models_dir, args.version)}")
+
+if __name__ == "__main__":
+    main()
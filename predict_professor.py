@@ -2,82 +2,203 @@
 """
 Professor Prediction Script
 Uses trained model to predict professor metrics from review data.
+
+Input is a JSON object with professor, subject and reviews, or
+{"batch": [{professor, subject, reviews}, ...]} to score many professors
+at once, in which case the output is {"results": [...]}. Adding
+"debug": true (or setting PREDICTION_DEBUG=1) adds per-stage timings and
+counters under "debug".
 """
 
+import time
+_IMPORT_START = time.perf_counter()
+
 import json
+import os
 import sys
-import numpy as np
-import pandas as pd
-from train_model import ProfessorRecommendationModel
+from professor_predictor import load_predictor
+from prediction_cache import PredictionCache, make_key
+from instrumentation import RequestProfiler, debug_enabled
 import warnings
 warnings.filterwarnings('ignore')
 
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
+
+def untrained_result():
+    """Default prediction used when no trained models exist"""
+    return {
+        'avg_rating': 4.0,
+        'avg_difficulty': 3.0,
+        'rating_consistency': 0.5,
+        'insights': [
+            "Model not trained yet. Using default predictions.",
+            "Train the model first using /api/train endpoint."
+        ],
+        'confidence': 0.1
+    }
+
+def fallback_result(pred_error):
+    """Fallback prediction used when the trained model fails"""
+    return {
+        'avg_rating': 3.5,
+        'avg_difficulty': 3.0,
+        'rating_consistency': 1.0,
+        'insights': [
+            f"Prediction error: {str(pred_error)[:100]}...",
+            "Using fallback predictions. Consider retraining the model."
+        ],
+        'confidence': 0.2
+    }
+
+def format_prediction(model, predictions):
+    """Turn model metrics into the JSON response for one professor"""
+    insights = model.generate_professor_insights(predictions)
+
+    return {
+        'avg_rating': float(predictions['avg_rating']),
+        'avg_difficulty': float(predictions['avg_difficulty']),
+        'rating_consistency': float(predictions['rating_consistency']),
+        'insights': insights,
+        'confidence': 0.8,
+        'individual_predictions': [float(x) for x in predictions['individual_predictions']]
+    }
+
+def debug_info(model, models_loaded):
+    """Instrumentation attached to responses of debug requests"""
+    info = {'model_version': model.model_version if models_loaded else None}
+    info.update(model.instrumentation.snapshot())
+    return info
+
+def build_prediction(model, input_data, models_loaded=True, cache=None):
+    """Build the prediction response for a single or batch request"""
+    if 'batch' in input_data:
+        result = {'results': build_batch_prediction(model, input_data['batch'], models_loaded, cache)}
+    else:
+        result = build_single_prediction(model, input_data, models_loaded, cache)
+
+    if debug_enabled(input_data):
+        # Copy so the debug data never ends up in a cached result
+        result = dict(result, debug=debug_info(model, models_loaded))
+    return result
+
+def build_single_prediction(model, input_data, models_loaded=True, cache=None):
+    """Build the prediction response for one professor"""
+    if not models_loaded:
+        # If models don't exist, create a simple prediction
+        return untrained_result()
+
+    try:
+        key = None
+        if cache is not None:
+            cache.set_model_version(model.model_version)
+            key = make_key(model.model_version, input_data['subject'], input_data['reviews'])
+            cached = cache.get(key)
+            model.instrumentation.count('prediction_cache_hits' if cached is not None else 'prediction_cache_misses')
+            if cached is not None:
+                return cached
+
+        # Use trained model for prediction
+        predictions = model.predict_professor_metrics(
+            input_data['professor'],
+            input_data['subject'],
+            input_data['reviews']
+        )
+        result = format_prediction(model, predictions)
+
+        if key is not None:
+            cache.put(key, result)
+        return result
+    except Exception as pred_error:
+        # Fallback if prediction fails
+        return fallback_result(pred_error)
+
+def _batch_group(group):
+    """The professor, subject and reviews of one batch group; raises ValueError if malformed"""
+    if not isinstance(group, dict):
+        raise ValueError(f"Batch group must be a JSON object, got {type(group).__name__}")
+    reviews = group.get('reviews')
+    if not isinstance(reviews, list) or not all(isinstance(review, str) for review in reviews):
+        raise ValueError("Batch group 'reviews' must be a list of strings")
+    return {'professor': group.get('professor'), 'subject': group.get('subject'), 'reviews': reviews}
+
+def build_batch_prediction(model, groups, models_loaded=True, cache=None):
+    """Build one prediction response per professor group in a single model pass
+
+    Malformed groups get a fallback result of their own; the rest still go
+    through the model.
+    """
+    if not models_loaded:
+        return [untrained_result() for _ in groups]
+
+    results = [None] * len(groups)
+    keys = [None] * len(groups)
+    valid = {}
+    for i, group in enumerate(groups):
+        try:
+            valid[i] = _batch_group(group)
+        except ValueError as group_error:
+            results[i] = fallback_result(group_error)
+
+    if cache is not None:
+        cache.set_model_version(model.model_version)
+        for i, group in valid.items():
+            keys[i] = make_key(model.model_version, group['subject'], group['reviews'])
+            results[i] = cache.get(keys[i])
+            model.instrumentation.count('prediction_cache_hits' if results[i] is not None else 'prediction_cache_misses')
+
+    # Only valid groups missing from the cache go through the model
+    pending = [i for i in valid if results[i] is None]
+    if not pending:
+        return results
+
+    try:
+        batch_predictions = model.predict_professor_metrics_batch([valid[i] for i in pending])
+    except Exception as pred_error:
+        for i in pending:
+            results[i] = fallback_result(pred_error)
+        return results
+
+    for i, predictions in zip(pending, batch_predictions):
+        if predictions is None:
+            results[i] = fallback_result("No reviews provided")
+        else:
+            results[i] = format_prediction(model, predictions)
+            if keys[i] is not None:
+                cache.put(keys[i], results[i])
+    return results
+
+def error_result(error):
+    """Response used when a request cannot be processed at all"""
+    return {
+        'error': str(error),
+        'avg_rating': 3.5,
+        'avg_difficulty': 3.0,
+        'rating_consistency': 1.0,
+        'insights': ['Error in prediction, using fallback values'],
+        'confidence': 0.0
+    }
+
 def main():
     try:
         # Read input from stdin
         input_data = json.loads(sys.stdin.read())
-        
-        # Initialize model
-        model = ProfessorRecommendationModel()
-        
-        # Try to load pre-trained models
-        if not model.load_models():
-            # If models don't exist, create a simple prediction
-            result = {
-                'avg_rating': 4.0,
-                'avg_difficulty': 3.0,
-                'rating_consistency': 0.5,
-                'insights': [
-                    "Model not trained yet. Using default predictions.",
-                    "Train the model first using /api/train endpoint."
-                ],
-                'confidence': 0.1
-            }
-        else:
-            try:
-                # Use trained model for prediction
-                predictions = model.predict_professor_metrics(
-                    input_data['professor'],
-                    input_data['subject'],
-                    input_data['reviews']
-                )
-                
-                insights = model.generate_professor_insights(predictions)
-                
-                result = {
-                    'avg_rating': float(predictions['avg_rating']),
-                    'avg_difficulty': float(predictions['avg_difficulty']),
-                    'rating_consistency': float(predictions['rating_consistency']),
-                    'insights': insights,
-                    'confidence': 0.8,
-                    'individual_predictions': [float(x) for x in predictions['individual_predictions']]
-                }
-            except Exception as pred_error:
-                # Fallback if prediction fails
-                result = {
-                    'avg_rating': 3.5,
-                    'avg_difficulty': 3.0,
-                    'rating_consistency': 1.0,
-                    'insights': [
-                        f"Prediction error: {str(pred_error)[:100]}...",
-                        "Using fallback predictions. Consider retraining the model."
-                    ],
-                    'confidence': 0.2
-                }
-        
+
+        # Slow runs leave a profile in PREDICTION_PROFILE_DIR when it is set
+        with RequestProfiler.from_env().profile('predict'):
+            # Load the published models with the lightest model that can serve them
+            model, models_loaded = load_predictor()
+            model.instrumentation.add_time('imports', IMPORT_SECONDS)
+
+            # A one-shot process only benefits from the on-disk cache tier
+            cache = PredictionCache.from_env() if os.environ.get('PREDICTION_CACHE_DB') else None
+
+            result = build_prediction(model, input_data, models_loaded, cache)
+
         # Output result as JSON
         print(json.dumps(result))
-        
+
     except Exception as e:
-        error_result = {
-            'error': str(e),
-            'avg_rating': 3.5,
-            'avg_difficulty': 3.0,
-            'rating_consistency': 1.0,
-            'insights': ['Error in prediction, using fallback values'],
-            'confidence': 0.0
-        }
-        print(json.dumps(error_result))
+        print(json.dumps(error_result(e)))
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Prediction Result Cache
+Caches formatted professor predictions so identical review lists are not
+featurized and scored again.
+
+Keys combine the model bundle version with a hash of the subject and the
+reviews, so retraining invalidates every entry automatically. Entries live
+in a bounded in-memory LRU with a TTL, optionally backed by a SQLite file
+that survives process restarts and is shared between worker processes.
+Each process opens its own connection to that file on first use, because
+SQLite connections must not be carried across fork().
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 3600
+
+def normalize_subject(subject):
+    """Subjects are encoded after fillna('Unknown'), so missing and 'Unknown' are the same"""
+    return 'Unknown' if subject is None else subject
+
+def make_key(model_version, subject, reviews):
+    """Cache key for one professor prediction
+
+    The professor name does not influence the prediction and is left out.
+    Review text is kept verbatim: whitespace and case feed the length and
+    word count features, so they are not normalized away.
+    """
+    payload = json.dumps(
+        [normalize_subject(subject), list(reviews)],
+        ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f"{model_version}:{digest}"
+
+class PredictionCache:
+    """Bounded LRU with TTL and an optional SQLite tier"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.model_version = None
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+        self._db = None
+        self._db_pid = None
+        self._inherited_connections = []
+
+    @classmethod
+    def from_env(cls):
+        """Cache configured by PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL and PREDICTION_CACHE_DB"""
+        return cls(
+            max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+            ttl=float(os.environ.get('PREDICTION_CACHE_TTL', DEFAULT_TTL)),
+            db_path=os.environ.get('PREDICTION_CACHE_DB') or None
+        )
+
+    def _connection(self):
+        """This process's SQLite connection, or None without a disk tier; call with the lock held"""
+        if not self.db_path:
+            return None
+        if self._db_pid != os.getpid():
+            if self._db is not None:
+                # Inherited from the parent: keep a reference so it is never used, closed or finalized here
+                self._inherited_connections.append(self._db)
+            self._db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                'key TEXT PRIMARY KEY, model_version TEXT, expires_at REAL, value TEXT)'
+            )
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    def set_model_version(self, model_version):
+        """Drop every entry computed by a different model version"""
+        if model_version == self.model_version:
+            return
+        with self._lock:
+            self.model_version = model_version
+            self.counters['invalidations'] += len(self._entries)
+            self._entries.clear()
+            db = self._connection()
+            if db is not None:
+                cursor = db.execute('DELETE FROM predictions WHERE model_version != ?', (str(model_version),))
+                self.counters['invalidations'] += cursor.rowcount
+                db.commit()
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    self.counters['memory_hits'] += 1
+                    return dict(value)
+                del self._entries[key]
+                self.counters['expirations'] += 1
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    'SELECT expires_at, value FROM predictions WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    expires_at, value = row
+                    if expires_at > now:
+                        value = json.loads(value)
+                        self._remember(key, expires_at, value)
+                        self.counters['hits'] += 1
+                        self.counters['disk_hits'] += 1
+                        return dict(value)
+                    db.execute('DELETE FROM predictions WHERE key = ?', (key,))
+                    db.commit()
+                    self.counters['expirations'] += 1
+
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, key, value):
+        """Store a value in memory and, if configured, on disk"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            db = self._connection()
+            if db is not None:
+                db.execute(
+                    'INSERT OR REPLACE INTO predictions (key, model_version, expires_at, value) VALUES (?, ?, ?, ?)',
+                    (key, key.split(':', 1)[0], expires_at, json.dumps(value))
+                )
+                db.commit()
+
+    def _remember(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def stats(self):
+        """Counters plus current size, for scraping"""
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+            stats['model_version'] = self.model_version
+            return stats
+
+    def purge_expired(self):
+        """Remove expired entries from both tiers"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+            self.counters['expirations'] += len(expired)
+            db = self._connection()
+            if db is not None:
+                cursor = db.execute('DELETE FROM predictions WHERE expires_at <= ?', (now,))
+                self.counters['expirations'] += cursor.rowcount
+                db.commit()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Professor Prediction Server
+Keeps the trained models resident in memory and answers newline-delimited
+JSON prediction requests over stdin/stdout or a local Unix socket.
+
+Each request line uses the same schema as predict_professor.py and each
+response line is the JSON object that script would print. Sending
+{"stats": true} returns the model version and prediction cache counters.
+Requests with "debug": true get the per-stage timings of that request,
+including a model reload if one happened while serving it.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from model_bundle import DEFAULT_MODEL_DIR
+from professor_predictor import load_predictor
+from predict_professor import build_prediction, error_result
+from prediction_cache import PredictionCache
+from instrumentation import RequestProfiler
+import warnings
+warnings.filterwarnings('ignore')
+
+class ModelHolder:
+    """Owns the resident model and reloads it when the models directory changes"""
+
+    def __init__(self, models_dir=DEFAULT_MODEL_DIR, check_interval=1.0, cache=None, profiler=None):
+        self.models_dir = models_dir
+        self.check_interval = check_interval
+        self.cache = cache
+        self.profiler = profiler or RequestProfiler()
+        self.model = None
+        self.models_loaded = False
+        self.signature = None
+        self._last_check = 0.0
+        self.reload()
+
+    def _signature(self):
+        """Cheap fingerprint of the models directory; publishing a bundle swaps CURRENT"""
+        try:
+            entries = []
+            for entry in os.scandir(self.models_dir):
+                # Caches and other working files also live here; only model files matter
+                if entry.name != 'CURRENT' and not entry.name.endswith(('.pkl', '.npy')):
+                    continue
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+            return tuple(sorted(entries))
+        except FileNotFoundError:
+            return ()
+
+    def reload(self):
+        """Load a fresh copy of the models and swap it in"""
+        # Take the signature first so a write that lands during loading
+        # is picked up by the next check
+        signature = self._signature()
+        model, models_loaded = load_predictor(self.models_dir)
+
+        if models_loaded or not self.models_loaded:
+            self.model = model
+            self.models_loaded = models_loaded
+            self.signature = signature
+        # Otherwise keep serving the previous models and retry on the next check
+        return models_loaded
+
+    def maybe_reload(self):
+        """Reload the models if the files changed since they were loaded"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+
+        if self._signature() != self.signature:
+            return self.reload()
+        return False
+
+    def handle(self, line):
+        """Answer a single request line (str or UTF-8 bytes); errors become error responses"""
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            input_data = json.loads(line)
+            if not isinstance(input_data, dict):
+                raise ValueError(f"Request must be a JSON object, got {type(input_data).__name__}")
+
+            if input_data.get('stats'):
+                return self.stats()
+
+            # Instrumentation covers one request at a time
+            self.model.instrumentation.reset()
+            with self.profiler.profile('request'):
+                self.maybe_reload()
+                return build_prediction(self.model, input_data, self.models_loaded, self.cache)
+        except Exception as e:
+            return error_result(e)
+
+    def stats(self):
+        """Scrapeable server state, requested with {"stats": true}"""
+        return {
+            'model_version': self.model.model_version if self.models_loaded else None,
+            'models_loaded': self.models_loaded,
+            'cache': self.cache.stats() if self.cache is not None else None
+        }
+
+def serve_stdio(holder, stdin=None, stdout=None):
+    """Serve requests line by line from stdin, writing one response per line"""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        stdout.write(json.dumps(holder.handle(line)) + '\n')
+        stdout.flush()
+
+def _serve_connection(holder, conn):
+    """Serve every request sent over one client connection"""
+    with conn:
+        reader = conn.makefile('rb')
+        for line in reader:
+            if not line.strip():
+                continue
+            # Decoded by handle(), so invalid UTF-8 becomes an error response
+            response = json.dumps(holder.handle(line)) + '\n'
+            conn.sendall(response.encode('utf-8'))
+
+def _worker_loop(holder, server):
+    """Accept connections forever on the shared listening socket"""
+    while True:
+        try:
+            conn, _ = server.accept()
+        except InterruptedError:
+            continue
+        try:
+            _serve_connection(holder, conn)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def serve_socket(holder, socket_path, workers=1):
+    """Serve requests on a Unix socket using one or more worker processes"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(128)
+    print(f"Prediction server listening on {socket_path} with {workers} worker(s)", file=sys.stderr)
+
+    if workers <= 1:
+        try:
+            _worker_loop(holder, server)
+        finally:
+            server.close()
+            os.unlink(socket_path)
+        return
+
+    # Pre-fork workers after the models are loaded so the pages are shared
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                _worker_loop(holder, server)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    try:
+        while children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            children.discard(pid)
+            if not stopping:
+                # Replace workers that died unexpectedly
+                spawn()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident professor prediction server')
+    parser.add_argument('--socket', help='Serve on this Unix socket path instead of stdin/stdout')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes in socket mode')
+    parser.add_argument('--models-dir', default=DEFAULT_MODEL_DIR, help='Directory watched for model changes')
+    parser.add_argument('--reload-interval', type=float, default=1.0,
+                        help='Minimum seconds between checks for changed models')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the prediction result cache')
+    parser.add_argument('--profile-dir', help='Write a sampled profile of every slow request to this directory')
+    parser.add_argument('--profile-threshold-ms', type=float, help='Requests slower than this are profiled')
+    args = parser.parse_args()
+
+    # Sized by PREDICTION_CACHE_SIZE / PREDICTION_CACHE_TTL, persisted to PREDICTION_CACHE_DB if set
+    cache = None if args.no_cache else PredictionCache.from_env()
+    profiler = RequestProfiler.from_env()
+    if args.profile_dir:
+        profiler.profile_dir = args.profile_dir
+    if args.profile_threshold_ms is not None:
+        profiler.threshold_ms = args.profile_threshold_ms
+    holder = ModelHolder(args.models_dir, args.reload_interval, cache, profiler)
+    if not holder.models_loaded:
+        print("No trained models found, serving default predictions until models appear", file=sys.stderr)
+
+    if args.socket:
+        serve_socket(holder, args.socket, max(1, args.workers))
+    else:
+        serve_stdio(holder)
+
+if __name__ == "__main__":
+    main()
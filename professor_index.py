@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Professor Aggregate Index
+Scores every review once and keeps per-professor, per-subject and
+per-professor-per-subject aggregates, so professor numbers and "best
+Physics professors" style rankings are lookups instead of model runs.
+
+The index is one columnar .npz file: for every table a key column, running
+sums (review count, rating, squared rating, difficulty), the derived
+averages, consistency and insights, and a ranking order by predicted
+rating. Appending reviews only scores the new ones and adds them to the
+sums. A version published by a full training triggers a full rebuild; a
+version that only folded new reviews into the previous one (train_model.py
+--update) keeps the existing sums and scores just the new reviews with it, so
+older reviews keep their scores from the earlier version until the next full
+training.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import numpy as np
+from model_bundle import DEFAULT_MODEL_DIR, load_bundle
+from professor_predictor import load_predictor, professor_insights
+from review_stream import iter_appended, iter_chunks, review_id
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'professor_index.npz')
+INDEX_FORMAT_VERSION = 1
+SCORE_CHUNK_SIZE = 10000
+
+TABLES = ('professor', 'subject', 'professor_subject')
+SUM_COLUMNS = ('count', 'rating_sum', 'rating_sq_sum', 'difficulty_sum')
+
+def _table_key(table, professor, subject):
+    if table == 'professor':
+        return professor
+    if table == 'subject':
+        return subject
+    return f"{professor}\0{subject}"
+
+class AggregateTable:
+    """Running sums and derived metrics for one grouping of reviews"""
+
+    def __init__(self, keys=(), sums=None, insight_codes=None, insight_texts=None):
+        self.keys = list(keys)
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.sums = sums or {name: np.zeros(len(self.keys)) for name in SUM_COLUMNS}
+        self._derive()
+        self.insight_codes = insight_codes
+        self.insight_texts = insight_texts
+
+    def add(self, keys, ratings, difficulties):
+        """Add scored reviews, creating rows for keys seen for the first time"""
+        rows = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = self.rows.get(key)
+            if row is None:
+                row = self.rows[key] = len(self.keys)
+                self.keys.append(key)
+            rows[i] = row
+
+        grown = len(self.keys) - len(self.sums['count'])
+        if grown:
+            for name in SUM_COLUMNS:
+                self.sums[name] = np.concatenate([self.sums[name], np.zeros(grown)])
+
+        np.add.at(self.sums['count'], rows, 1)
+        np.add.at(self.sums['rating_sum'], rows, ratings)
+        np.add.at(self.sums['rating_sq_sum'], rows, np.square(ratings))
+        np.add.at(self.sums['difficulty_sum'], rows, difficulties)
+        self._derive()
+
+    def _derive(self):
+        """Averages, consistency (population std of predicted ratings) and rating order"""
+        count = np.maximum(self.sums['count'], 1)
+        self.avg_rating = self.sums['rating_sum'] / count
+        self.avg_difficulty = self.sums['difficulty_sum'] / count
+        variance = self.sums['rating_sq_sum'] / count - self.avg_rating ** 2
+        self.consistency = np.sqrt(np.maximum(variance, 0.0))
+        # Best first; ties keep insertion order
+        self.rating_order = np.argsort(-self.avg_rating, kind='stable')
+        # Insights are recomputed lazily, once per batch of updates
+        self.insight_codes = None
+        self.insight_texts = None
+
+    def _materialize_insights(self):
+        """Intern the insight lines of every row: three codes per row into a table of texts"""
+        texts = {}
+        codes = np.zeros((len(self.keys), 3), dtype=np.int16)
+        for row in range(len(self.keys)):
+            insights = professor_insights({
+                'avg_rating': self.avg_rating[row],
+                'avg_difficulty': self.avg_difficulty[row],
+                'rating_consistency': self.consistency[row],
+            })
+            for j, text in enumerate(insights):
+                codes[row, j] = texts.setdefault(text, len(texts))
+        self.insight_codes = codes
+        self.insight_texts = list(texts)
+
+    def record(self, row):
+        if self.insight_codes is None:
+            self._materialize_insights()
+        return {
+            'avg_rating': float(self.avg_rating[row]),
+            'avg_difficulty': float(self.avg_difficulty[row]),
+            'rating_consistency': float(self.consistency[row]),
+            'review_count': int(self.sums['count'][row]),
+            'insights': [self.insight_texts[code] for code in self.insight_codes[row]],
+        }
+
+    def columns(self, prefix):
+        """Arrays written to the index file for this table"""
+        columns = {f'{prefix}.key': np.array(self.keys, dtype=str)}
+        for name in SUM_COLUMNS:
+            columns[f'{prefix}.{name}'] = self.sums[name]
+        columns[f'{prefix}.avg_rating'] = self.avg_rating
+        columns[f'{prefix}.avg_difficulty'] = self.avg_difficulty
+        columns[f'{prefix}.consistency'] = self.consistency
+        columns[f'{prefix}.rating_order'] = self.rating_order
+        if self.insight_codes is None:
+            self._materialize_insights()
+        columns[f'{prefix}.insight_codes'] = self.insight_codes
+        columns[f'{prefix}.insight_texts'] = np.array(self.insight_texts, dtype=str)
+        return columns
+
+    @classmethod
+    def from_columns(cls, data, prefix):
+        keys = [str(key) for key in data[f'{prefix}.key']]
+        sums = {name: np.array(data[f'{prefix}.{name}'], dtype=np.float64) for name in SUM_COLUMNS}
+        return cls(keys, sums, np.array(data[f'{prefix}.insight_codes']),
+                   [str(text) for text in data[f'{prefix}.insight_texts']])
+
+class ProfessorIndex:
+    """Aggregates for every professor, subject and professor/subject pair"""
+
+    def __init__(self, tables=None, meta=None):
+        self.tables = tables or {name: AggregateTable() for name in TABLES}
+        self.meta = meta or {
+            'format_version': INDEX_FORMAT_VERSION,
+            'model_version': None,
+            'reviews_indexed': 0,
+            'last_review_id': None,
+        }
+        self._subjects_by_professor = None
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format_version') != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported professor index format in {path}")
+            tables = {name: AggregateTable.from_columns(data, name) for name in TABLES}
+        return cls(tables, meta)
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        """Write the index atomically"""
+        columns = {'meta': np.array(json.dumps(self.meta))}
+        for name, table in self.tables.items():
+            columns.update(table.columns(name))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.professor-index-', suffix='.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **columns)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def add_scores(self, professors, subjects, ratings, difficulties):
+        """Fold scored reviews into every table"""
+        ratings = np.asarray(ratings, dtype=np.float64)
+        difficulties = np.asarray(difficulties, dtype=np.float64)
+        for name, table in self.tables.items():
+            keys = [_table_key(name, p, s) for p, s in zip(professors, subjects)]
+            table.add(keys, ratings, difficulties)
+        self._subjects_by_professor = None
+
+    def professor(self, name):
+        """Aggregates for one professor, with a breakdown by subject, or None"""
+        table = self.tables['professor']
+        row = table.rows.get(name)
+        if row is None:
+            return None
+        result = dict(table.record(row), professor=name)
+
+        if self._subjects_by_professor is None:
+            self._subjects_by_professor = {}
+            for pair_row, key in enumerate(self.tables['professor_subject'].keys):
+                self._subjects_by_professor.setdefault(key.split('\0', 1)[0], []).append(pair_row)
+        pairs = self.tables['professor_subject']
+        result['subjects'] = [
+            dict(pairs.record(pair_row), subject=pairs.keys[pair_row].split('\0', 1)[1])
+            for pair_row in self._subjects_by_professor.get(name, [])
+        ]
+        return result
+
+    def subject(self, name):
+        """Aggregates over every review of one subject, or None"""
+        table = self.tables['subject']
+        row = table.rows.get(name)
+        return None if row is None else dict(table.record(row), subject=name)
+
+    def _matching_subjects(self, subject):
+        """The subject and every subject extending it by whole words ("Physics" -> "Physics", "Physics 101")"""
+        query = subject.casefold()
+        return {
+            key for key in self.tables['subject'].keys
+            if key.casefold() == query or key.casefold()[:len(query) + 1] in (query + ' ', query + ':')
+        }
+
+    def top_professors(self, subject=None, n=10, min_reviews=1, lowest=False):
+        """Professors ranked by predicted rating, overall or within a subject"""
+        if subject is None:
+            table = self.tables['professor']
+            wanted = None
+        else:
+            table = self.tables['professor_subject']
+            wanted = self._matching_subjects(subject)
+            if not wanted:
+                return []
+
+        order = table.rating_order[::-1] if lowest else table.rating_order
+        results = []
+        for row in order:
+            if table.sums['count'][row] < min_reviews:
+                continue
+            if wanted is None:
+                results.append(dict(table.record(row), professor=table.keys[row]))
+            else:
+                professor, row_subject = table.keys[row].split('\0', 1)
+                if row_subject not in wanted:
+                    continue
+                results.append(dict(table.record(row), professor=professor, subject=row_subject))
+            if len(results) >= n:
+                break
+        return results
+
+def _score_reviews(model, reviews):
+    """Predicted rating and difficulty for each review, scored with its own subject"""
+    groups = [{'professor': r.get('professor'), 'subject': r.get('subject'), 'reviews': [r['review']]}
+              for r in reviews]
+    predictions = model.predict_professor_metrics_batch(groups)
+    ratings = np.array([p['avg_rating'] for p in predictions])
+    difficulties = np.array([p['avg_difficulty'] for p in predictions])
+    return ratings, difficulties
+
+def _usable(review):
+    return isinstance(review.get('review'), str) and review['review'].strip() and review.get('professor')
+
+def _extends(model_dir, version, indexed_version):
+    """Whether version was built from indexed_version by incremental updates only"""
+    while version is not None and indexed_version is not None:
+        if version == indexed_version:
+            return True
+        try:
+            training = load_bundle(model_dir, version).manifest.get('training', {})
+        except (FileNotFoundError, ValueError):
+            return False
+        if training.get('mode') != 'incremental':
+            return False
+        version = training.get('base_version')
+    return False
+
+def update_index(data_path='data/reviews.json', index_path=DEFAULT_INDEX_PATH, model_dir=None,
+                 chunk_size=SCORE_CHUNK_SIZE, rebuild=False):
+    """Score reviews appended since the last update; rebuild if the model was retrained or the data changed
+
+    Returns (index, reviews_added, rebuilt).
+    """
+    model_dir = model_dir or DEFAULT_MODEL_DIR
+    model, models_loaded = load_predictor(model_dir)
+    if not models_loaded:
+        raise RuntimeError("No trained models found; train the model before building the index")
+
+    index = None
+    upgraded = False
+    if not rebuild and os.path.exists(index_path):
+        index = ProfessorIndex.load(index_path)
+        upgraded = index.meta['model_version'] != model.model_version
+        if _extends(model_dir, model.model_version, index.meta['model_version']):
+            index.meta['model_version'] = model.model_version
+        else:
+            index = None
+
+    rebuilt = index is None
+    if rebuilt:
+        index = ProfessorIndex()
+        index.meta['model_version'] = model.model_version
+
+    # reviews.json is append-only; rescore everything if indexed reviews changed
+    position = index.meta['reviews_indexed']
+    try:
+        reviews = iter_appended(data_path, position, index.meta['last_review_id'])
+    except ValueError:
+        return update_index(data_path, index_path, model_dir, chunk_size, rebuild=True)
+
+    added = 0
+    for chunk in iter_chunks(reviews, chunk_size):
+        usable = [review for review in chunk if _usable(review)]
+        if usable:
+            ratings, difficulties = _score_reviews(model, usable)
+            index.add_scores([r['professor'] for r in usable],
+                             ['Unknown' if r.get('subject') is None else r['subject'] for r in usable],
+                             ratings, difficulties)
+            added += len(usable)
+        position += len(chunk)
+        index.meta['reviews_indexed'] = position
+        index.meta['last_review_id'] = review_id(chunk[-1])
+
+    if added or rebuilt or upgraded:
+        index.save(index_path)
+    return index, added, rebuilt
+
+def main():
+    parser = argparse.ArgumentParser(description='Precomputed professor and subject aggregates')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help='Index file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = subparsers.add_parser('update', help='Score new reviews and update the aggregates')
+    update_parser.add_argument('--data', default='data/reviews.json')
+    update_parser.add_argument('--models-dir', default=DEFAULT_MODEL_DIR)
+    update_parser.add_argument('--rebuild', action='store_true', help='Rescore every review')
+
+    professor_parser = subparsers.add_parser('professor', help='Aggregates for one professor')
+    professor_parser.add_argument('name')
+    subject_parser = subparsers.add_parser('subject', help='Aggregates for one subject')
+    subject_parser.add_argument('name')
+
+    top_parser = subparsers.add_parser('top', help='Professors ranked by predicted rating')
+    top_parser.add_argument('--subject', help='Subject name or prefix, e.g. "Physics"')
+    top_parser.add_argument('-n', type=int, default=10)
+    top_parser.add_argument('--min-reviews', type=int, default=1)
+    top_parser.add_argument('--lowest', action='store_true', help='Lowest rated first')
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        index, added, rebuilt = update_index(args.data, args.index, args.models_dir, rebuild=args.rebuild)
+        action = 'Rebuilt index with' if rebuilt else 'Added'
+        print(f"{action} {added} reviews; {len(index.tables['professor'].keys)} professors, "
+              f"{len(index.tables['subject'].keys)} subjects (model {index.meta['model_version']})")
+        return
+
+    index = ProfessorIndex.load(args.index)
+    if args.command == 'professor':
+        result = index.professor(args.name)
+    elif args.command == 'subject':
+        result = index.subject(args.name)
+    else:
+        result = index.top_professors(args.subject, args.n, args.min_reviews, args.lowest)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
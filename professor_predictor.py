@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Lightweight Professor Predictor
+Serves predictions from a published model bundle using NumPy alone, so a
+one-shot prediction does not pay for importing pandas, scipy, scikit-learn
+or NLTK.
+
+The TF-IDF transform, subject encoding and forest evaluation reproduce
+ProfessorRecommendationModel exactly. Bundles this path cannot serve
+(streaming models, legacy pickles) are loaded through the full model by
+load_predictor().
+"""
+
+import os
+import re
+import numpy as np
+from model_bundle import DEFAULT_MODEL_DIR, load_bundle
+from compiled_forest import CompiledForests
+from instrumentation import Instrumentation
+
+# TfidfVectorizer settings the compact transform reproduces
+SUPPORTED_TFIDF_PARAMS = {
+    'analyzer': 'word',
+    'binary': False,
+    'lowercase': True,
+    'ngram_range': [1, 1],
+    'norm': 'l2',
+    'preprocessor': None,
+    'strip_accents': None,
+    'sublinear_tf': False,
+    'tokenizer': None,
+    'use_idf': True,
+}
+
+class UnsupportedBundle(Exception):
+    """The bundle needs the full scikit-learn model to be served"""
+
+def professor_insights(professor_data):
+    """Generate insights about a professor"""
+    insights = []
+
+    avg_rating = professor_data['avg_rating']
+    difficulty = professor_data['avg_difficulty']
+    consistency = professor_data['rating_consistency']
+
+    # Rating insights
+    if avg_rating >= 4.5:
+        insights.append("Excellent professor with outstanding student satisfaction")
+    elif avg_rating >= 4.0:
+        insights.append("Very good professor with high student approval")
+    elif avg_rating >= 3.5:
+        insights.append("Good professor with generally positive reviews")
+    elif avg_rating >= 3.0:
+        insights.append("Average professor with mixed reviews")
+    else:
+        insights.append("Below average professor, consider alternatives")
+
+    # Difficulty insights
+    if difficulty <= 2.0:
+        insights.append("Course is relatively easy")
+    elif difficulty <= 3.5:
+        insights.append("Moderate difficulty level")
+    else:
+        insights.append("Challenging course, requires significant effort")
+
+    # Consistency insights
+    if consistency <= 0.5:
+        insights.append("Very consistent teaching quality")
+    elif consistency <= 1.0:
+        insights.append("Generally consistent performance")
+    else:
+        insights.append("Variable teaching quality across different aspects")
+
+    return insights
+
+def summarize_groups(counts, predicted_ratings, predicted_difficulty):
+    """Per-group metrics over the contiguous segments of stacked review predictions
+
+    Returns one metrics dict per group, in order, with None for groups without reviews.
+    """
+    results = [None] * len(counts)
+    group_ids = np.flatnonzero(counts)
+    sizes = counts[group_ids]
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+
+    avg_ratings = np.add.reduceat(predicted_ratings, starts) / sizes
+    avg_difficulty = np.add.reduceat(predicted_difficulty, starts) / sizes
+    deviations = predicted_ratings - np.repeat(avg_ratings, sizes)
+    rating_consistency = np.sqrt(np.add.reduceat(deviations ** 2, starts) / sizes)
+
+    for k, group_id in enumerate(group_ids):
+        results[group_id] = {
+            'avg_rating': avg_ratings[k],
+            'avg_difficulty': avg_difficulty[k],
+            'rating_consistency': rating_consistency[k],
+            'individual_predictions': list(predicted_ratings[starts[k]:ends[k]])
+        }
+    return results
+
+class CompactTfidf:
+    """Dense TF-IDF transform over a fitted vocabulary, equivalent to TfidfVectorizer.transform"""
+
+    def __init__(self, terms, idf, token_pattern):
+        self.vocabulary = {str(term): i for i, term in enumerate(terms)}
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.token_pattern = re.compile(token_pattern)
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        spec = bundle.manifest['vectorizer']
+        params = spec['params']
+        if spec['kind'] != 'tfidf' or any(params.get(k) != v for k, v in SUPPORTED_TFIDF_PARAMS.items()):
+            raise UnsupportedBundle(f"Vectorizer settings not supported by the compact transform: {spec}")
+        return cls(bundle.load_array('vocabulary.npy'), bundle.load_array('idf.npy'), params['token_pattern'])
+
+    def transform(self, documents):
+        # Stopwords can never be in the fitted vocabulary, so filtering by
+        # vocabulary alone matches the vectorizer's stop_words handling
+        vocabulary = self.vocabulary
+        rows, cols = [], []
+        for row, document in enumerate(documents):
+            for token in self.token_pattern.findall(document.lower()):
+                col = vocabulary.get(token)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+
+        features = np.zeros((len(documents), len(self.idf)))
+        np.add.at(features, (np.array(rows, dtype=int), np.array(cols, dtype=int)), 1.0)
+        features *= self.idf
+        norms = np.sqrt(np.einsum('ij,ij->i', features, features))
+        norms[norms == 0] = 1.0
+        return features / norms[:, None]
+
+class ProfessorPredictor:
+    """Prediction-only counterpart of ProfessorRecommendationModel"""
+
+    def __init__(self, model_dir=None):
+        self.model_dir = model_dir or DEFAULT_MODEL_DIR
+        self.model_version = None
+        self.instrumentation = Instrumentation()
+        self.text_preprocessor = None
+        self.vectorizer = None
+        self.subject_index = None
+        self.compiled_forests = None
+
+    def load_models(self):
+        """Load the current bundle; raises UnsupportedBundle if it needs the full model"""
+        with self.instrumentation.stage('load_models'):
+            bundle = load_bundle(self.model_dir)
+            if bundle.manifest['estimator'] != 'compiled_forest':
+                raise UnsupportedBundle("Bundle estimators are pickled, not compiled")
+            self.text_preprocessor = bundle.build_text_preprocessor()
+            if self.text_preprocessor is None:
+                raise UnsupportedBundle("Bundle has no stored text preprocessing resources")
+
+            self.vectorizer = CompactTfidf.from_bundle(bundle)
+            subjects = bundle.load_array('subjects.npy')
+            self.subject_index = {str(subject): code for code, subject in enumerate(subjects)}
+            self.compiled_forests = CompiledForests.load(os.path.join(bundle.path, 'forests.npy'))
+            self.model_version = bundle.version
+            return True
+
+    def extract_features(self, reviews, subjects):
+        """Dense feature matrix: TF-IDF columns, then subject code, review length and word count"""
+        instrumentation = self.instrumentation
+        instrumentation.count('rows_featurized', len(reviews))
+
+        with instrumentation.stage('featurize.preprocess'):
+            processed_reviews = self.text_preprocessor.preprocess_many(reviews, n_jobs=1)
+        with instrumentation.stage('featurize.vectorize'):
+            text_features = self.vectorizer.transform(processed_reviews)
+        instrumentation.gauge('vocabulary_size', len(self.vectorizer.vocabulary))
+
+        with instrumentation.stage('featurize.subjects'):
+            subject_codes = [self.subject_index.get('Unknown' if s is None else s, 0) for s in subjects]
+
+        with instrumentation.stage('featurize.assemble'):
+            n_text = text_features.shape[1]
+            features = np.empty((len(reviews), n_text + 3))
+            features[:, :n_text] = text_features
+            features[:, n_text] = subject_codes
+            features[:, n_text + 1] = [len(r) if isinstance(r, str) else 0 for r in reviews]
+            features[:, n_text + 2] = [len(r.split()) if isinstance(r, str) else 0 for r in reviews]
+        return features
+
+    def predict_professor_metrics(self, professor_name, subject, sample_reviews):
+        """Predict metrics for a professor based on review samples"""
+        predictions = self.predict_professor_metrics_batch([{
+            'professor': professor_name,
+            'subject': subject,
+            'reviews': sample_reviews
+        }])[0]
+
+        if predictions is None:
+            raise ValueError("At least one review is required for prediction")
+
+        return predictions
+
+    def predict_professor_metrics_batch(self, groups):
+        """Predict metrics for many professors in a single featurize/predict pass"""
+        instrumentation = self.instrumentation
+        counts = np.array([len(group['reviews']) for group in groups], dtype=int)
+        instrumentation.count('groups_predicted', len(groups))
+        if counts.sum() == 0:
+            return [None] * len(groups)
+
+        with instrumentation.stage('predict.stack'):
+            reviews = [review for group in groups for review in group['reviews']]
+            subjects = [group.get('subject') for group in groups for _ in group['reviews']]
+
+        X = self.extract_features(reviews, subjects)
+        with instrumentation.stage('predict.forests'):
+            predicted_ratings, predicted_difficulty = self.compiled_forests.predict(X)
+
+        with instrumentation.stage('predict.aggregate'):
+            return summarize_groups(counts, predicted_ratings, predicted_difficulty)
+
+    def generate_professor_insights(self, professor_data):
+        return professor_insights(professor_data)
+
+def load_predictor(model_dir=None):
+    """The cheapest model able to serve model_dir, and whether trained models were loaded
+
+    Uses ProfessorPredictor when the current bundle allows it and otherwise
+    imports the full training model, which also reads legacy pickles.
+    """
+    model_dir = model_dir or DEFAULT_MODEL_DIR
+    predictor = ProfessorPredictor(model_dir)
+    try:
+        return predictor, predictor.load_models()
+    except FileNotFoundError:
+        if not os.path.exists(os.path.join(model_dir, 'vectorizer.pkl')):
+            # Nothing trained yet; no need to import the full model to find out
+            return predictor, False
+    except UnsupportedBundle:
+        pass
+    except Exception:
+        return predictor, False
+
+    from train_model import ProfessorRecommendationModel
+    model = ProfessorRecommendationModel(model_dir)
+    return model, model.load_models()
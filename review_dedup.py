@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Review Detection
+Drops repeated and near-identical reviews before they reach featurization,
+using MinHash signatures over the preprocessed tokens and locality-sensitive
+hashing (LSH) buckets.
+
+Signatures of every kept review are stored in a persistent SQLite index
+together with their LSH band keys, so each new review is compared only with
+the few earlier reviews sharing a bucket instead of the whole history.
+Buckets are scoped to the professor: identical short praise for two
+different professors is not a duplicate, while a scraped review posted
+twice for the same professor is.
+
+A full pass over a corpus starts from an empty index, so reviews are only
+compared with other reviews of that corpus; an edited review is never a
+duplicate of its own old version. Passes over appended reviews are checked
+against everything recorded since, and later passes over the same corpus
+within one training run can reuse the decisions of the first.
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import zlib
+from collections import Counter
+import numpy as np
+from review_stream import iter_reviews, iter_chunks, review_id
+
+NUM_PERM = 128
+BANDS = 16  # 8 rows per band: candidate pairs start around Jaccard 0.7
+SHINGLE_SIZE = 2
+# Reviews shorter than this (in preprocessed tokens) are only checked for exact repeats
+MIN_TOKENS = 5
+SIMILARITY_THRESHOLD = 0.8
+MINHASH_CHUNK_SIZE = 1000
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+class MinHasher:
+    """MinHash signatures of token shingles, computed in vectorized chunks"""
+
+    def __init__(self, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=1):
+        rng = np.random.RandomState(seed)
+        # Coefficients below 2**31 keep a * x + b within uint64 for 32-bit x
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def shingles(self, tokens):
+        """32-bit hashes of the distinct token n-grams (single tokens for very short texts)"""
+        size = min(self.shingle_size, len(tokens))
+        grams = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+        return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams))
+
+    def signatures(self, token_lists):
+        """One uint32 signature row per non-empty token list"""
+        signatures = np.empty((len(token_lists), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(token_lists), MINHASH_CHUNK_SIZE):
+            shingles = [self.shingles(tokens) for tokens in token_lists[start:start + MINHASH_CHUNK_SIZE]]
+            sizes = np.array([len(s) for s in shingles])
+            hashed = (np.concatenate(shingles)[:, None] * self.a + self.b) % np.uint64(_MERSENNE_PRIME) & _MAX_HASH
+            offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            signatures[start:start + len(shingles)] = np.minimum.reduceat(hashed, offsets, axis=0)
+        return signatures
+
+def _professor_key(professor):
+    return ' '.join(str(professor).lower().split()) if professor is not None else ''
+
+class SignatureIndex:
+    """SQLite-backed MinHash signatures and LSH buckets of previously seen reviews"""
+
+    def __init__(self, db_path, num_perm=NUM_PERM, bands=BANDS, shingle_size=SHINGLE_SIZE,
+                 threshold=SIMILARITY_THRESHOLD):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.db_path = db_path
+        self.bands = bands
+        self.threshold = threshold
+        self.minhasher = MinHasher(num_perm, shingle_size)
+        self._db = sqlite3.connect(db_path, timeout=30.0)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._create_tables()
+        self._params = {'num_perm': num_perm, 'bands': bands, 'shingle_size': shingle_size}
+
+    def _create_tables(self):
+        # reason is NULL for kept reviews; only kept reviews have signatures and band entries
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS reviews ('
+            'id BLOB PRIMARY KEY, reason TEXT, duplicate_of BLOB, signature BLOB)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS bands (key BLOB, id BLOB, PRIMARY KEY (key, id)) WITHOUT ROWID'
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def check_params(self, preprocessing_signature):
+        """Clear the index when it was built with other MinHash settings or preprocessing"""
+        params = json.dumps(dict(self._params, preprocessing=preprocessing_signature), sort_keys=True)
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+        if row is not None and row[0] == params:
+            return False
+        if row is not None:
+            print("Signature index was built with other settings; rebuilding")
+        self.clear()
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('params', ?)", (params,))
+        self._db.commit()
+        return row is not None
+
+    def clear(self):
+        self._db.execute('DROP TABLE IF EXISTS reviews')
+        self._db.execute('DROP TABLE IF EXISTS bands')
+        self._create_tables()
+
+    def size(self):
+        kept, dropped = self._db.execute(
+            'SELECT COUNT(*) - COUNT(reason), COUNT(reason) FROM reviews'
+        ).fetchone()
+        return {'kept': kept, 'dropped': dropped}
+
+    def _select(self, query, keys):
+        """Rows of `query` (with one IN placeholder list) for every key, in parameter-limited batches"""
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + LOOKUP_BATCH_SIZE]
+            yield from self._db.execute(query.format(','.join('?' * len(batch))), batch)
+
+    def decisions(self, ids):
+        """Earlier reason (None when kept) for the ids already in the index"""
+        return dict(self._select('SELECT id, reason FROM reviews WHERE id IN ({})', ids))
+
+    def band_keys(self, professor, signature):
+        """Bucket keys of one signature, scoped to the professor"""
+        prefix = _professor_key(professor).encode('utf-8') + b'\0'
+        data = signature.tobytes()
+        width = len(data) // self.bands
+        return [
+            hashlib.blake2b(prefix + bytes([band]) + data[band * width:(band + 1) * width], digest_size=8).digest()
+            for band in range(self.bands)
+        ]
+
+    def bucket_members(self, keys):
+        members = {}
+        for key, member in self._select('SELECT key, id FROM bands WHERE key IN ({})', keys):
+            members.setdefault(key, []).append(member)
+        return members
+
+    def signatures(self, ids):
+        return {
+            member: np.frombuffer(signature, dtype=np.uint32)
+            for member, signature in self._select('SELECT id, signature FROM reviews WHERE id IN ({})', ids)
+        }
+
+    def forget(self, ids):
+        """Remove the decisions and band entries of the given reviews"""
+        for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            batch = ids[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            self._db.execute(f'DELETE FROM reviews WHERE id IN ({placeholders})', batch)
+            self._db.execute(f'DELETE FROM bands WHERE id IN ({placeholders})', batch)
+        self._db.commit()
+
+    def record(self, rows, band_rows):
+        """Store decisions (id, reason, duplicate_of, signature) and the band entries of kept reviews"""
+        self._db.executemany(
+            'INSERT OR IGNORE INTO reviews (id, reason, duplicate_of, signature) VALUES (?, ?, ?, ?)', rows
+        )
+        self._db.executemany('INSERT OR IGNORE INTO bands (key, id) VALUES (?, ?)', band_rows)
+        self._db.commit()
+
+class ReviewDeduplicator:
+    """One pass over a corpus, checking each batch of reviews against the signature index
+
+    Within a pass, every repeat of a review (same professor, subject and
+    text) after the first is an exact duplicate. A full pass clears the
+    index first, unless reuse_decisions=True: the corpus is then the one the
+    previous full pass recorded, and its reviews keep the decisions made
+    then. With appended=True the batches are new reviews, checked against
+    the index as it is, and a review already in it is a repeat of one seen
+    before.
+    """
+
+    def __init__(self, index, preprocessor, feature_cache=None, appended=False, reuse_decisions=False):
+        self.index = index
+        self.preprocessor = preprocessor
+        self.feature_cache = feature_cache
+        self.appended = appended
+        self.dropped = Counter()
+        self._seen = set()
+        self._recorded = []
+        index.check_params(preprocessor.signature())
+        if not appended and not reuse_decisions:
+            index.clear()
+
+    def _tokens(self, texts):
+        if self.feature_cache is not None:
+            # Featurization counts every row once later on; leave the cache statistics to it
+            processed = self.feature_cache.featurize(texts, self.preprocessor, count=False)[0]
+        else:
+            processed = self.preprocessor.preprocess_many(texts)
+        return [text.split() for text in processed]
+
+    def keep_mask(self, reviews):
+        """Boolean mask of the reviews to keep; counts the others in self.dropped by reason"""
+        ids = [bytes.fromhex(review_id(review)) for review in reviews]
+        earlier = self.index.decisions(list(set(ids)))
+        keep = np.zeros(len(reviews), dtype=bool)
+
+        new = []
+        for i, rid in enumerate(ids):
+            if rid in self._seen:
+                self.dropped['exact_duplicate'] += 1
+                continue
+            self._seen.add(rid)
+            if rid not in earlier:
+                new.append(i)
+            elif self.appended:
+                self.dropped['exact_duplicate'] += 1
+            elif earlier[rid] is None:
+                keep[i] = True
+            else:
+                self.dropped[earlier[rid]] += 1
+
+        if new:
+            self._check_new(reviews, ids, new, keep)
+        return keep
+
+    def _check_new(self, reviews, ids, new, keep):
+        """Sign reviews not seen before, compare them with their bucket members and record them"""
+        index = self.index
+        texts = [reviews[i].get('review') for i in new]
+        tokens = self._tokens([text if isinstance(text, str) else '' for text in texts])
+        signed = [k for k, t in enumerate(tokens) if len(t) >= MIN_TOKENS]
+        signatures = dict(zip(signed, index.minhasher.signatures([tokens[k] for k in signed])))
+        keys = {k: index.band_keys(reviews[new[k]].get('professor'), signatures[k]) for k in signed}
+
+        members = index.bucket_members(list({key for k in signed for key in keys[k]}))
+        candidate_ids = list({member for bucket in members.values() for member in bucket})
+        known = index.signatures(candidate_ids)
+
+        rows, band_rows = [], []
+        for k, i in enumerate(new):
+            duplicate_of = None
+            if k in signatures:
+                signature = signatures[k]
+                candidates = {member for key in keys[k] for member in members.get(key, ())}
+                for member in candidates:
+                    if np.mean(known[member] == signature) >= index.threshold:
+                        duplicate_of = member
+                        break
+
+            if duplicate_of is not None:
+                self.dropped['near_duplicate'] += 1
+                rows.append((ids[i], 'near_duplicate', duplicate_of, None))
+                continue
+
+            keep[i] = True
+            if k not in signatures:
+                rows.append((ids[i], None, None, None))
+                continue
+            rows.append((ids[i], None, None, signatures[k].tobytes()))
+            # Later reviews of this batch are compared with this one too
+            known[ids[i]] = signatures[k]
+            for key in keys[k]:
+                members.setdefault(key, []).append(ids[i])
+                band_rows.append((key, ids[i]))
+
+        index.record(rows, band_rows)
+        self._recorded.extend(row[0] for row in rows)
+
+    def forget(self):
+        """Undo what this pass recorded, e.g. when the reviews it checked were not used after all"""
+        self.index.forget(self._recorded)
+        self._recorded = []
+
+def main():
+    import os
+    from model_bundle import DEFAULT_MODEL_DIR, load_bundle
+    from text_preprocessing import TextPreprocessor
+
+    parser = argparse.ArgumentParser(description='Detect repeated and near-identical reviews')
+    parser.add_argument('--db', default=os.path.join(DEFAULT_MODEL_DIR, 'review_signatures.sqlite'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help='Show how many reviews the index has kept and dropped')
+    scan_parser = subparsers.add_parser('scan', help='Rebuild the index from a review file, or add appended reviews')
+    scan_parser.add_argument('--data', default='data/reviews.json')
+    scan_parser.add_argument('--chunk-size', type=int, default=10000)
+    scan_parser.add_argument('--appended', action='store_true',
+                             help='Treat the file as new reviews; repeats of indexed reviews are dropped')
+    subparsers.add_parser('reset', help='Forget every recorded review')
+    args = parser.parse_args()
+
+    index = SignatureIndex(args.db)
+    if args.command == 'stats':
+        size = index.size()
+        print(f"{size['kept']} kept and {size['dropped']} dropped reviews in {args.db}")
+    elif args.command == 'scan':
+        # Tokens must match the ones training uses, so prefer the published bundle's preprocessing
+        try:
+            preprocessor = load_bundle(os.path.dirname(os.path.abspath(args.db))).build_text_preprocessor()
+        except FileNotFoundError:
+            preprocessor = None
+        dedup = ReviewDeduplicator(index, preprocessor or TextPreprocessor(), appended=args.appended)
+        if not args.appended:
+            print(f"Rebuilding {args.db} from {args.data}")
+        total = kept = 0
+        for chunk in iter_chunks(iter_reviews(args.data), args.chunk_size):
+            total += len(chunk)
+            kept += int(dedup.keep_mask(chunk).sum())
+        print(json.dumps({'reviews': total, 'kept': kept, 'dropped': dict(dedup.dropped)}, indent=2))
+    elif args.command == 'reset':
+        index.clear()
+        print(f"Cleared {args.db}")
+    index.close()
+
+if __name__ == "__main__":
+    main()
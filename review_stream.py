@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Review Streaming
+Incremental readers for review data, so large corpora never have to be
+loaded into memory at once.
+"""
+
+import hashlib
+import itertools
+import json
+import re
+
+_WHITESPACE = re.compile(r'\s*')
+
+def iter_reviews(path, key='reviews', block_size=1 << 16):
+    """Yield reviews one at a time from a JSON Lines file or a {"reviews": [...]} JSON file"""
+    if path.endswith(('.jsonl', '.ndjson')):
+        return _iter_json_lines(path)
+    return _iter_json_array(path, key, block_size)
+
+def _iter_json_lines(path):
+    """Yield one review per non-empty line"""
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def _iter_json_array(path, key, block_size):
+    """Yield the items of the top-level array under `key`, reading the file in blocks"""
+    decoder = json.JSONDecoder()
+    marker = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+
+    with open(path, 'r') as f:
+        # Find the opening bracket of the reviews array
+        buf = ''
+        while True:
+            match = marker.search(buf)
+            if match:
+                pos = match.end()
+                break
+            block = f.read(block_size)
+            if not block:
+                raise ValueError(f"No '{key}' array found in {path}")
+            buf += block
+
+        # Decode items one by one, pulling in more of the file when an item is cut off
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos < len(buf):
+                if buf[pos] == ']':
+                    return
+                if buf[pos] == ',':
+                    pos += 1
+                    continue
+                try:
+                    item, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    pass
+                else:
+                    yield item
+                    continue
+
+            block = f.read(block_size)
+            if not block:
+                raise ValueError(f"Unexpected end of file while reading '{key}' from {path}")
+            buf = buf[pos:] + block
+            pos = 0
+
+def iter_chunks(items, chunk_size):
+    """Group an iterable into lists of at most chunk_size items"""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def review_id(review):
+    """Stable id for a review, derived from its professor, subject and text"""
+    payload = json.dumps(
+        [review.get('professor'), review.get('subject'), review.get('review')],
+        ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def iter_appended(path, seen, last_review_id):
+    """Reviews after the first `seen` ones, for files that are only ever appended to
+
+    Raises ValueError when the file no longer starts with the reviews seen
+    before, i.e. the review at position seen - 1 is not last_review_id.
+    """
+    reviews = iter_reviews(path)
+    position = 0
+    last_review = None
+    for last_review in itertools.islice(reviews, seen):
+        position += 1
+    if seen and (position < seen or review_id(last_review) != last_review_id):
+        raise ValueError(f"{path} changed before review {seen}; previously seen reviews were edited or removed")
+    return reviews
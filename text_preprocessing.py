@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Review Text Preprocessing
+Batch engine behind ProfessorRecommendationModel.preprocess_text.
+
+Produces exactly the same tokens as the original NLTK pipeline
+(lowercase, strip non-letters, word_tokenize, drop stopwords, Porter stem)
+so existing vectorizers stay valid, but compiles everything once, uses a
+whitespace tokenizer and memoizes stems. Stemming uses a vendored copy of
+NLTK's Porter stemmer, so a preprocessor built with an explicit stopword
+list never imports NLTK or reads its data files.
+"""
+
+import functools
+import hashlib
+import os
+import re
+from porter_stemmer import PorterStemmer
+
+# Anything that is not a letter or whitespace is removed before tokenizing
+CLEAN_PATTERN = re.compile(r'[^a-zA-Z\s]')
+
+# Once punctuation is stripped, the only splits NLTK's word tokenizer still
+# makes are these contractions (its CONTRACTIONS2 rules without apostrophes)
+CONTRACTION_SPLITS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+
+# Corpora smaller than this are not worth the process pool startup cost
+PARALLEL_MIN_TEXTS = 20000
+PARALLEL_CHUNK_SIZE = 2000
+STEM_CACHE_SIZE = 100000
+
+class TextPreprocessor:
+    """Fast, memoized equivalent of the NLTK review preprocessing"""
+
+    def __init__(self, stop_words=None, stem_cache_size=STEM_CACHE_SIZE, fallback=None):
+        # When stop_words/fallback are not given they are resolved from NLTK on first use
+        self.stop_words = frozenset(stop_words) if stop_words is not None else None
+        self.fallback = fallback if fallback is not None else (False if stop_words is not None else None)
+        self.stem_cache_size = stem_cache_size
+        self._stem = None
+        self._ready = False
+
+    def _load_resources(self):
+        """Resolve stopwords and the stemmer once, mirroring the NLTK pipeline's failure mode"""
+        if self.fallback is None:
+            try:
+                from nltk.corpus import stopwords
+                from nltk.tokenize import word_tokenize
+                # The original pipeline returns the cleaned text untouched whenever
+                # the tokenizer or stopword data is missing, so do the same here
+                word_tokenize('probe')
+                self.stop_words = frozenset(stopwords.words('english'))
+                self.fallback = False
+            except Exception:
+                self.fallback = True
+
+        if not self.fallback:
+            self._stem = functools.lru_cache(maxsize=self.stem_cache_size)(PorterStemmer().stem)
+        self._ready = True
+
+    @property
+    def mode(self):
+        """'stem' for the full pipeline, 'fallback' when NLTK data was unavailable"""
+        if not self._ready:
+            self._load_resources()
+        return 'fallback' if self.fallback else 'stem'
+
+    def signature(self):
+        """Identifies the preprocessing output, so caches never mix different modes"""
+        if not self._ready:
+            self._load_resources()
+        if self.fallback:
+            return 'fallback-v1'
+        digest = hashlib.sha1('\n'.join(sorted(self.stop_words)).encode('utf-8')).hexdigest()[:16]
+        return f'nltk-v1-{digest}'
+
+    def clean(self, text):
+        """Lowercase and strip everything but letters and whitespace"""
+        return CLEAN_PATTERN.sub('', text.lower())
+
+    def preprocess(self, text):
+        """Clean and preprocess review text"""
+        if not isinstance(text, str):
+            return ""
+
+        text = self.clean(text)
+
+        if not self._ready:
+            self._load_resources()
+        if self.fallback:
+            return text
+
+        tokens = text.split()
+        if not CONTRACTION_SPLITS.keys().isdisjoint(tokens):
+            tokens = [part for word in tokens for part in CONTRACTION_SPLITS.get(word, (word,))]
+
+        stop_words = self.stop_words
+        stem = self._stem
+        return ' '.join([stem(word) for word in tokens if word not in stop_words])
+
+    def preprocess_many(self, texts, n_jobs=None):
+        """Preprocess a batch of texts, fanning out to a process pool for large corpora
+
+        n_jobs=None uses every core once the batch reaches PARALLEL_MIN_TEXTS,
+        n_jobs=1 always runs in-process and n_jobs=-1 always uses every core.
+        """
+        texts = list(texts)
+        if not self._ready:
+            self._load_resources()
+
+        if n_jobs is None:
+            n_jobs = -1 if len(texts) >= PARALLEL_MIN_TEXTS else 1
+        if n_jobs < 0:
+            n_jobs = os.cpu_count() or 1
+
+        if n_jobs <= 1 or len(texts) < 2 * PARALLEL_CHUNK_SIZE or self.fallback:
+            return [self.preprocess(text) for text in texts]
+
+        # Imported here: multiprocessing adds noticeably to prediction start-up
+        from concurrent.futures import ProcessPoolExecutor
+        chunks = [texts[i:i + PARALLEL_CHUNK_SIZE] for i in range(0, len(texts), PARALLEL_CHUNK_SIZE)]
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_worker,
+            initargs=(sorted(self.stop_words), self.stem_cache_size)
+        ) as executor:
+            processed = []
+            for chunk_result in executor.map(_preprocess_chunk, chunks):
+                processed.extend(chunk_result)
+        return processed
+
+# Per-process preprocessor used by the pool workers
+_worker_preprocessor = None
+
+def _init_worker(stop_words, stem_cache_size):
+    global _worker_preprocessor
+    _worker_preprocessor = TextPreprocessor(stop_words=stop_words, stem_cache_size=stem_cache_size)
+
+def _preprocess_chunk(texts):
+    return [_worker_preprocessor.preprocess(text) for text in texts]
@@ -4,126 +4,279 @@ Professor Recommendation Model Training Pipeline
 Trains a custom model on professor review data for better recommendations.
 """
 
+import argparse
+import contextlib
+import itertools
 import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV, KFold
 from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.preprocessing import StandardScaler, LabelEncoder, MaxAbsScaler
+from scipy.sparse import csr_matrix
 import joblib
-import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import PorterStemmer
+from text_preprocessing import TextPreprocessor
+from review_stream import iter_reviews, iter_chunks, iter_appended, review_id
+from incremental_models import IncrementalRegressor
+from compiled_forest import CompiledForests, compile_forests, merge_compiled_forests
+from feature_cache import FeatureCache
+from review_dedup import SignatureIndex, ReviewDeduplicator
+from model_bundle import DEFAULT_MODEL_DIR, CurrentVersionChanged, publish_bundle, load_bundle
+from professor_predictor import professor_insights, summarize_groups
+from instrumentation import Instrumentation
 import warnings
 warnings.filterwarnings('ignore')
 
-# Download required NLTK data
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
-except:
-    print("NLTK downloads failed, continuing without preprocessing...")
+def download_nltk_data():
+    """Fetch the NLTK tokenizer and stopword data; training falls back to plain cleaning without them"""
+    import nltk
+    try:
+        nltk.download('punkt', quiet=True)
+        nltk.download('punkt_tab', quiet=True)  # word_tokenize needs this on NLTK 3.9+
+        nltk.download('stopwords', quiet=True)
+    except:
+        print("NLTK downloads failed, continuing without preprocessing...")
+
+# Candidate forest settings for the optional cross-validated search
+SEARCH_PARAM_GRID = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [10, 20, None],
+    'max_features': [1.0, 'sqrt', 0.3],
+}
+
+# Incremental updates request a full retrain once reviews folded in since the
+# last one cross any of these limits
+DRIFT_THRESHOLDS = {
+    'oov_increase': 0.15,          # share of out-of-vocabulary tokens above the training corpus
+    'unknown_subject_rate': 0.3,   # share of reviews for subjects the encoder never saw
+    'error_ratio': 1.5,            # rating MSE on new reviews relative to the training test MSE
+    'incremental_fraction': 0.5,   # reviews added incrementally relative to the last full training set
+}
+# Updates redone on top of versions published while they ran before giving up
+UPDATE_ATTEMPTS = 3
+# Rate-based drift checks need this many incrementally added reviews
+DRIFT_MIN_REVIEWS = 20
+RETRAIN_MARKER = 'RETRAIN_REQUESTED'
 
 class ProfessorRecommendationModel:
-    def __init__(self):
+    def __init__(self, model_dir=None, n_jobs=-1):
+        self.model_dir = model_dir or DEFAULT_MODEL_DIR
+        self.model_version = None
+        self.manifest = None
+        self.n_jobs = n_jobs
         self.vectorizer = TfidfVectorizer(max_features=500, stop_words='english', min_df=1, max_df=0.95)
-        self.rating_model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42)
-        self.difficulty_model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42)
+        self.rating_model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42, n_jobs=n_jobs)
+        self.difficulty_model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42, n_jobs=n_jobs)
         self.scaler = StandardScaler()
         self.subject_encoder = LabelEncoder()
-        self.stemmer = PorterStemmer()
+        self.text_preprocessor = TextPreprocessor()
+        self.compiled_forests = None
+        self.feature_cache = None
+        self.feature_cache_stats = None
+        self.instrumentation = Instrumentation()
         
     def preprocess_text(self, text):
         """Clean and preprocess review text"""
-        if not isinstance(text, str):
-            return ""
-        
-        # Convert to lowercase and remove special characters
-        text = re.sub(r'[^a-zA-Z\s]', '', text.lower())
-        
-        try:
-            # Tokenize and remove stopwords
-            tokens = word_tokenize(text)
-            stop_words = set(stopwords.words('english'))
-            tokens = [self.stemmer.stem(word) for word in tokens if word not in stop_words]
-            return ' '.join(tokens)
-        except:
-            # Fallback if NLTK fails
-            return text
+        return self.text_preprocessor.preprocess(text)
+    
+    def encode_subjects(self, subjects):
+        """Encode subjects row by row, using a default value for subjects not seen during training"""
+        subject_index = {subject: code for code, subject in enumerate(self.subject_encoder.classes_)}
+        return np.array([subject_index.get(subject, 0) for subject in subjects], dtype=int)
     
     def extract_features(self, df, is_training=True):
         """Extract features from review data"""
-        # Text features from reviews
-        processed_reviews = df['review'].apply(self.preprocess_text)
-        
-        if is_training:
-            text_features = self.vectorizer.fit_transform(processed_reviews)
-        else:
-            text_features = self.vectorizer.transform(processed_reviews)
+        instrumentation = self.instrumentation
+        instrumentation.count('rows_featurized', len(df))
+        
+        # Text features from reviews, reusing cached preprocessing when available
+        with instrumentation.stage('featurize.preprocess'):
+            if self.feature_cache is not None:
+                cached_before = self.feature_cache.stats['cached']
+                processed_reviews, review_length, word_count = self.feature_cache.featurize(
+                    df['review'], self.text_preprocessor
+                )
+                instrumentation.count('feature_cache_hits', self.feature_cache.stats['cached'] - cached_before)
+            else:
+                processed_reviews = self.text_preprocessor.preprocess_many(df['review'])
+                review_length = df['review'].str.len().fillna(0)
+                word_count = df['review'].str.split().str.len().fillna(0)
+        
+        with instrumentation.stage('featurize.vectorize'):
+            if is_training:
+                text_features = self.vectorizer.fit_transform(processed_reviews)
+            else:
+                text_features = self.vectorizer.transform(processed_reviews)
+        if hasattr(self.vectorizer, 'vocabulary_'):
+            instrumentation.gauge('vocabulary_size', len(self.vectorizer.vocabulary_))
         
         # Subject encoding
-        subjects_filled = df['subject'].fillna('Unknown')
-        if is_training:
-            subject_features = self.subject_encoder.fit_transform(subjects_filled)
-        else:
-            # Handle unknown subjects during prediction
-            try:
-                subject_features = self.subject_encoder.transform(subjects_filled)
-            except ValueError:
-                # If subject not seen during training, use a default value
-                subject_features = np.zeros(len(subjects_filled), dtype=int)
-        
-        # Additional features
-        review_length = df['review'].str.len().fillna(0)
-        word_count = df['review'].str.split().str.len().fillna(0)
-        
-        # Combine all features
-        additional_features = np.column_stack([
-            subject_features,
-            review_length,
-            word_count
-        ])
-        
-        # Combine text and additional features
-        from scipy.sparse import hstack
-        all_features = hstack([text_features, additional_features])
+        with instrumentation.stage('featurize.subjects'):
+            subjects_filled = df['subject'].fillna('Unknown')
+            if is_training:
+                subject_features = self.subject_encoder.fit_transform(subjects_filled)
+            else:
+                # Handle unknown subjects during prediction
+                subject_features = self.encode_subjects(subjects_filled)
+        
+        with instrumentation.stage('featurize.assemble'):
+            # Combine all features
+            additional_features = np.column_stack([
+                subject_features,
+                review_length,
+                word_count
+            ])
+            
+            # Combine text and additional features
+            from scipy.sparse import hstack
+            all_features = hstack([text_features, additional_features])
         
         return all_features
     
-    def train(self, data_path='data/reviews.json'):
-        """Train the recommendation models"""
-        print("Loading training data...")
-        
-        # Load data
-        with open(data_path, 'r') as f:
-            data = json.load(f)
-        
-        df = pd.DataFrame(data['reviews'])
-        print(f"Loaded {len(df)} reviews from file")
-        
-        # Add synthetic data for better training
-        synthetic_data = create_synthetic_professor_data()
-        synthetic_df = pd.DataFrame(synthetic_data)
-        print(f"Adding {len(synthetic_df)} synthetic reviews for training")
-        
-        # Combine real and synthetic data
-        df = pd.concat([df, synthetic_df], ignore_index=True)
-        print(f"Total dataset size: {len(df)} reviews")
-        
-        # Clean data
+    def _warn_if_fallback(self):
+        """Full trainings without NLTK data publish models that neither drop stopwords nor stem"""
+        if self.text_preprocessor.mode == 'fallback':
+            print("WARNING: NLTK tokenizer/stopword data not found; training with fallback preprocessing "
+                  "(no stopword removal or stemming). Run train_model.py with network access and without "
+                  "--offline to fetch it.", file=sys.stderr)
+    
+    def clean_reviews(self, df, dropped=None):
+        """Drop reviews without text or a valid star rating, counting them by reason in `dropped`"""
         df['stars'] = pd.to_numeric(df['stars'], errors='coerce')
+        if dropped is not None:
+            missing_review = df['review'].isna()
+            dropped['missing_review'] = dropped.get('missing_review', 0) + int(missing_review.sum())
+            dropped['invalid_stars'] = dropped.get('invalid_stars', 0) + int((~missing_review & ~(df['stars'] > 0)).sum())
         df = df.dropna(subset=['stars', 'review'])
-        df = df[df['stars'] > 0]  # Remove invalid ratings
-        
-        print(f"After cleaning: {len(df)} reviews")
+        return df[df['stars'] > 0]  # Remove invalid ratings
+    
+    @contextlib.contextmanager
+    def _deduplicating(self, enabled=True, appended=False, reuse_decisions=False):
+        """Check reviews against the persistent signature index for the duration of one pass"""
+        if not enabled:
+            yield None
+            return
+        
+        os.makedirs(self.model_dir, exist_ok=True)
+        index = SignatureIndex(os.path.join(self.model_dir, 'review_signatures.sqlite'))
+        try:
+            yield ReviewDeduplicator(index, self.text_preprocessor, self.feature_cache,
+                                     appended=appended, reuse_decisions=reuse_decisions)
+        finally:
+            index.close()
+    
+    def deduplicate_reviews(self, df, deduplicator, rows=None):
+        """Drop repeated and near-identical reviews among `rows` (a boolean mask, default all) of a cleaned frame"""
+        rows = np.ones(len(df), dtype=bool) if rows is None else np.asarray(rows)
+        columns = df.loc[rows, ['professor', 'subject', 'review']]
+        records = columns.astype(object).where(columns.notna(), None).to_dict('records')
+        keep = np.ones(len(df), dtype=bool)
+        keep[rows] = deduplicator.keep_mask(records)
+        return df[keep]
+    
+    def _report_dropped(self, dropped):
+        dropped = {reason: n for reason, n in dropped.items() if n}
+        if dropped:
+            print("Dropped rows: " + ', '.join(f"{n} {reason.replace('_', ' ')}" for reason, n in dropped.items()))
+        return dropped
+    
+    @contextlib.contextmanager
+    def _using_feature_cache(self, enabled=True):
+        """Serve preprocessing from the persistent per-review cache for the duration of a training run"""
+        if not enabled:
+            yield
+            return
+        
+        os.makedirs(self.model_dir, exist_ok=True)
+        self.feature_cache = FeatureCache(os.path.join(self.model_dir, 'feature_cache.sqlite'))
+        try:
+            yield
+        finally:
+            self.feature_cache_stats = dict(self.feature_cache.stats)
+            print(f"Feature cache: {self.feature_cache_stats['cached']} reviews served from cache, "
+                  f"{self.feature_cache_stats['recomputed']} recomputed")
+            self.feature_cache.close()
+            self.feature_cache = None
+    
+    @contextlib.contextmanager
+    def _timed(self, timings, stage):
+        """Record the wall-clock time of a training stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[stage] = time.perf_counter() - start
+            self.instrumentation.add_time(f'train.{stage}', timings[stage])
+    
+    def _search_forest_params(self, X, y, param_grid=None, cv=3):
+        """Cross-validated search for forest settings over an already featurized matrix"""
+        search = GridSearchCV(
+            RandomForestRegressor(random_state=42, n_jobs=1),
+            param_grid or SEARCH_PARAM_GRID,
+            cv=KFold(n_splits=cv, shuffle=True, random_state=42),
+            scoring='neg_mean_squared_error',
+            n_jobs=self.n_jobs,
+            refit=False
+        )
+        search.fit(X, y)
+        print(f"Best forest settings: {search.best_params_} (CV MSE: {-search.best_score_:.3f})")
+        return search.best_params_
+    
+    def train(self, data_path='data/reviews.json', use_feature_cache=True, search=False, parallel=True, dedup=True):
+        """Train the recommendation models
+        
+        With dedup=True repeated and near-identical real reviews are dropped
+        before featurization (see review_dedup). With parallel=True the two forests are fitted concurrently, each building its
+        trees on n_jobs cores. With search=True a cross-validated grid search over
+        SEARCH_PARAM_GRID picks the forest settings first; the difficulty target is a
+        function of the rating, so both forests share the settings found for rating.
+        """
+        timings = {}
+        print("Loading training data...")
         
-        # Extract features
-        print("Extracting features...")
-        X = self.extract_features(df, is_training=True)
+        with self._timed(timings, 'load'):
+            # Load data ({"reviews": [...]} JSON or JSON Lines)
+            reviews = list(iter_reviews(data_path))
+            df = pd.DataFrame(reviews, columns=['professor', 'subject', 'stars', 'review'])
+            n_real = len(df)
+            print(f"Loaded {n_real} reviews from file")
+            
+            # Add synthetic data for better training
+            synthetic_data = create_synthetic_professor_data()
+            synthetic_df = pd.DataFrame(synthetic_data)
+            print(f"Adding {len(synthetic_df)} synthetic reviews for training")
+            
+            # Combine real and synthetic data
+            df = pd.concat([df, synthetic_df], ignore_index=True)
+            print(f"Total dataset size: {len(df)} reviews")
+            
+            # Clean data
+            dropped = {}
+            df = self.clean_reviews(df, dropped)
+            
+            print(f"After cleaning: {len(df)} reviews")
+        
+        with self._using_feature_cache(use_feature_cache):
+            # Synthetic reviews are generated from templates, so only real ones are deduplicated
+            if dedup:
+                with self._timed(timings, 'dedup'), self._deduplicating() as deduplicator:
+                    df = self.deduplicate_reviews(df, deduplicator, rows=df.index < n_real)
+                    dropped.update(deduplicator.dropped)
+                print(f"After deduplication: {len(df)} reviews")
+            dropped = self._report_dropped(dropped)
+            
+            self._warn_if_fallback()
+            
+            # Extract features once; CSR lets every fold and tree reuse the same matrix
+            print("Extracting features...")
+            with self._timed(timings, 'featurize'):
+                X = self.extract_features(df, is_training=True).tocsr()
         
         # Prepare targets
         y_rating = df['stars'].values
@@ -134,15 +287,6 @@ class ProfessorRecommendationModel:
             X, y_rating, y_difficulty, test_size=0.2, random_state=42
         )
         
-        # Train rating prediction model
-        print("Training rating prediction model...")
-        self.rating_model.fit(X_train, y_rating_train)
-        rating_pred = self.rating_model.predict(X_test)
-        rating_r2 = r2_score(y_rating_test, rating_pred)
-        rating_mse = mean_squared_error(y_rating_test, rating_pred)
-        
-        # Train difficulty prediction model (use a different approach)
-        print("Training difficulty prediction model...")
         # Create more realistic difficulty targets based on review sentiment
         difficulty_targets = []
         for i, rating in enumerate(y_rating_train):
@@ -151,112 +295,489 @@ class ProfessorRecommendationModel:
             base_difficulty = 6 - rating  # Inverse of rating
             difficulty_targets.append(max(1, min(5, base_difficulty)))
         
-        self.difficulty_model.fit(X_train, difficulty_targets)
-        diff_pred = self.difficulty_model.predict(X_test)
-        diff_r2 = r2_score(y_diff_test, diff_pred)
-        diff_mse = mean_squared_error(y_diff_test, diff_pred)
+        best_params = None
+        if search:
+            print("Searching forest hyperparameters...")
+            with self._timed(timings, 'search'):
+                best_params = self._search_forest_params(X_train, y_rating_train)
+            self.rating_model.set_params(**best_params)
+            self.difficulty_model.set_params(**best_params)
+        
+        # Freshly fitted forests replace any compiled ones loaded earlier
+        self.compiled_forests = None
+        
+        # Train rating and difficulty prediction models
+        print("Training rating and difficulty prediction models...")
+        with self._timed(timings, 'fit'):
+            if parallel:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    rating_fit = executor.submit(self.rating_model.fit, X_train, y_rating_train)
+                    difficulty_fit = executor.submit(self.difficulty_model.fit, X_train, difficulty_targets)
+                    rating_fit.result()
+                    difficulty_fit.result()
+            else:
+                self.rating_model.fit(X_train, y_rating_train)
+                self.difficulty_model.fit(X_train, difficulty_targets)
+        
+        with self._timed(timings, 'evaluate'):
+            rating_pred = self.rating_model.predict(X_test)
+            rating_r2 = r2_score(y_rating_test, rating_pred)
+            rating_mse = mean_squared_error(y_rating_test, rating_pred)
+            
+            diff_pred = self.difficulty_model.predict(X_test)
+            diff_r2 = r2_score(y_diff_test, diff_pred)
+            diff_mse = mean_squared_error(y_diff_test, diff_pred)
         
         # Print results
         print(f"\nModel Performance:")
         print(f"Rating Model - R²: {rating_r2:.3f}, MSE: {rating_mse:.3f}")
         print(f"Difficulty Model - R²: {diff_r2:.3f}, MSE: {diff_mse:.3f}")
         
-        # Save models
-        self.save_models()
-        
-        return {
+        metrics = {
             'rating_r2': rating_r2,
             'rating_mse': rating_mse,
             'difficulty_r2': diff_r2,
             'difficulty_mse': diff_mse
         }
+        
+        # Save models
+        with self._timed(timings, 'save'):
+            self.save_models(metrics, dict(
+                self._full_training_info(reviews, df),
+                timings=timings,
+                dropped_rows=dropped,
+                forest_params=best_params,
+                counters=dict(self.instrumentation.counters, **self.instrumentation.gauges)
+            ))
+        
+        self._print_timings(timings)
+        return dict(metrics, timings=timings, forest_params=best_params)
+    
+    def _print_timings(self, timings):
+        print("\nStage timings:")
+        for stage, seconds in timings.items():
+            print(f"  {stage:<10} {seconds:8.3f}s")
+        print(f"  {'total':<10} {sum(timings.values()):8.3f}s")
+    
+    def _oov_counts(self, texts):
+        """Out-of-vocabulary and total token counts after preprocessing, or None for hashed features"""
+        if not hasattr(self.vectorizer, 'vocabulary_'):
+            return None
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        oov = total = 0
+        for processed in self.text_preprocessor.preprocess_many(texts):
+            tokens = analyzer(processed)
+            total += len(tokens)
+            oov += sum(1 for token in tokens if token not in vocabulary)
+        return oov, total
+    
+    def _full_training_info(self, data_reviews, df=None, total_reviews=None):
+        """Training info that lets later incremental updates find new reviews and measure drift"""
+        seen = 0
+        last_review = None
+        for last_review in data_reviews:
+            seen += 1
+        
+        oov_rate = None
+        if df is not None:
+            counts = self._oov_counts(df['review'])
+            if counts is not None and counts[1]:
+                oov_rate = counts[0] / counts[1]
+        
+        return {
+            'mode': 'full',
+            'data_reviews': seen,
+            'last_review_id': review_id(last_review) if last_review is not None else None,
+            'reviews_trained': int(total_reviews if total_reviews is not None else len(df)),
+            'base_trees': getattr(self.rating_model, 'n_estimators', None),
+            'oov_rate': oov_rate,
+            'updates': 0,
+            'since_retrain': {'reviews': 0, 'oov_tokens': 0, 'tokens': 0, 'unknown_subjects': 0,
+                              'squared_error': 0.0},
+        }
+    
+    def update(self, data_path='data/reviews.json', dedup=True):
+        """Fold reviews appended since the published version into the models and publish the result
+        
+        Compiled forests get extra trees fitted on the new reviews, as many as
+        the new reviews' share of the data warrants; incremental regressors are
+        updated with partial_fit. The vocabulary and subject encoder stay fixed.
+        A full retrain is requested (see RETRAIN_MARKER) when drift metrics over
+        everything added since the last full training cross DRIFT_THRESHOLDS.
+        If another version is published while the update runs, the update is
+        redone on top of it rather than replacing it, up to UPDATE_ATTEMPTS times.
+        Returns the drift report, or None when there was nothing to add.
+        """
+        for attempt in range(1, UPDATE_ATTEMPTS + 1):
+            try:
+                return self._update(data_path, dedup)
+            except CurrentVersionChanged as e:
+                if attempt == UPDATE_ATTEMPTS:
+                    raise
+                print(f"{e}; redoing the update on the new version")
+    
+    def _update(self, data_path, dedup):
+        if not self.load_models() or self.manifest is None:
+            raise ValueError("Incremental updates need a published model bundle; run a full training first")
+        training = self.manifest['training']
+        if 'data_reviews' not in training:
+            raise ValueError(f"Model version {self.model_version} predates incremental updates; run a full training")
+        
+        try:
+            new_reviews = list(iter_appended(data_path, training['data_reviews'], training['last_review_id']))
+        except ValueError as e:
+            self.request_retrain([str(e)])
+            raise
+        if not new_reviews:
+            print(f"No new reviews since version {self.model_version}")
+            return None
+        
+        dropped = {}
+        df = self.clean_reviews(pd.DataFrame(new_reviews, columns=['professor', 'subject', 'stars', 'review']), dropped)
+        with self._deduplicating(dedup, appended=True) as deduplicator:
+            if deduplicator is not None:
+                df = self.deduplicate_reviews(df, deduplicator)
+                dropped.update(deduplicator.dropped)
+            try:
+                return self._fold_reviews(df, new_reviews, training, self._report_dropped(dropped))
+            except BaseException:
+                if deduplicator is not None:
+                    # Nothing was published, so the next update checks these reviews again
+                    deduplicator.forget()
+                raise
+    
+    def _fold_reviews(self, df, new_reviews, training, dropped):
+        """Fit the cleaned new reviews into the loaded models and publish them on top of their version"""
+        print(f"Folding {len(df)} new reviews into version {self.model_version}...")
+        since = dict(training['since_retrain'])
+        info = dict(training, mode='incremental', base_version=self.model_version,
+                    data_reviews=training['data_reviews'] + len(new_reviews),
+                    last_review_id=review_id(new_reviews[-1]), dropped_rows=dropped)
+        
+        if len(df) > 0:
+            X = self.extract_features(df, is_training=False).tocsr()
+            y_rating = df['stars'].values
+            y_difficulty = np.clip(6 - y_rating, 1, 5)  # Inverse relationship as heuristic
+            
+            # Drift is measured on the models as they were before seeing these reviews
+            if self.compiled_forests is not None:
+                predicted_ratings = self.compiled_forests.predict(X)[0]
+            else:
+                predicted_ratings = self.rating_model.predict(X)
+            oov = self._oov_counts(df['review'])
+            known_subjects = set(self.subject_encoder.classes_)
+            since['reviews'] += len(df)
+            since['squared_error'] += float(((y_rating - predicted_ratings) ** 2).sum())
+            since['unknown_subjects'] += int(sum(s not in known_subjects for s in df['subject'].fillna('Unknown')))
+            if oov is not None:
+                since['oov_tokens'] += oov[0]
+                since['tokens'] += oov[1]
+            
+            if self.compiled_forests is not None:
+                info['delta_trees'] = self._add_delta_trees(X, y_rating, y_difficulty, training)
+            elif isinstance(self.rating_model, IncrementalRegressor):
+                self.rating_model.partial_fit(X, y_rating)
+                self.difficulty_model.partial_fit(X, y_difficulty)
+            else:
+                raise ValueError("These models do not support incremental updates; run a full training")
+        
+        info['updates'] = training['updates'] + 1
+        info['since_retrain'] = since
+        drift = self._drift_report(since, training)
+        info['drift'] = drift
+        
+        # Metrics stay those of the last full training, the baseline for drift checks
+        self.save_models(self.manifest['metrics'], info, base_version=info['base_version'])
+        if drift['retrain_reasons']:
+            self.request_retrain(drift['retrain_reasons'])
+        return drift
+    
+    def _add_delta_trees(self, X, y_rating, y_difficulty, training):
+        """Fit small forests on the new reviews and append their trees to the compiled forests"""
+        represented = training['reviews_trained'] + training['since_retrain']['reviews']
+        base_trees = training.get('base_trees') or len(self.compiled_forests.roots[0])
+        n_trees = max(1, int(round(base_trees * len(y_rating) / max(represented, 1))))
+        
+        params = dict(self.rating_model.get_params(), **(training.get('forest_params') or {}))
+        params.update(n_estimators=n_trees, random_state=42 + training['updates'] + 1)
+        delta = [RandomForestRegressor(**params).fit(X, y) for y in (y_rating, y_difficulty)]
+        
+        record = merge_compiled_forests([self.compiled_forests.to_record(), compile_forests(delta)])
+        self.compiled_forests = CompiledForests(record)
+        print(f"Added {n_trees} trees per forest")
+        return n_trees
+    
+    def _drift_report(self, since, training):
+        """Drift metrics over reviews added since the last full training, and the limits they cross"""
+        n = since['reviews']
+        report = {
+            'reviews_since_retrain': n,
+            'incremental_fraction': n / max(training['reviews_trained'], 1),
+            'oov_rate': since['oov_tokens'] / since['tokens'] if since['tokens'] else None,
+            'unknown_subject_rate': since['unknown_subjects'] / n if n else 0.0,
+            'rating_mse': since['squared_error'] / n if n else None,
+        }
+        
+        reasons = []
+        if report['incremental_fraction'] > DRIFT_THRESHOLDS['incremental_fraction']:
+            reasons.append(f"{n} reviews added since the last full training")
+        if n >= DRIFT_MIN_REVIEWS:
+            baseline_oov = training.get('oov_rate')
+            if (report['oov_rate'] is not None and baseline_oov is not None
+                    and report['oov_rate'] - baseline_oov > DRIFT_THRESHOLDS['oov_increase']):
+                reasons.append(f"out-of-vocabulary rate {report['oov_rate']:.2f} vs {baseline_oov:.2f} at training")
+            if report['unknown_subject_rate'] > DRIFT_THRESHOLDS['unknown_subject_rate']:
+                reasons.append(f"{report['unknown_subject_rate']:.0%} of new reviews are for unknown subjects")
+            baseline_mse = self.manifest['metrics'].get('rating_mse')
+            if baseline_mse and report['rating_mse'] > DRIFT_THRESHOLDS['error_ratio'] * baseline_mse:
+                reasons.append(f"rating MSE {report['rating_mse']:.3f} on new reviews vs {baseline_mse:.3f} at training")
+        report['retrain_reasons'] = reasons
+        return report
+    
+    def request_retrain(self, reasons):
+        """Leave a marker for the scheduled job that runs full retrains"""
+        os.makedirs(self.model_dir, exist_ok=True)
+        with open(os.path.join(self.model_dir, RETRAIN_MARKER), 'w') as f:
+            json.dump({'requested_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                       'model_version': self.model_version, 'reasons': reasons}, f, indent=2)
+        print("Full retrain requested: " + '; '.join(reasons))
+    
+    def retrain_requested(self):
+        return os.path.exists(os.path.join(self.model_dir, RETRAIN_MARKER))
+    
+    def _iter_training_chunks(self, data_path, chunk_size, dedup=False, dropped=None, reuse_decisions=False):
+        """Yield cleaned dataframes of at most chunk_size reviews, real data first then synthetic
+        
+        With dedup=True repeated and near-identical real reviews are dropped;
+        `dropped` collects the number of rows dropped by reason. Passes after
+        the first of a training run set reuse_decisions to skip re-checking.
+        """
+        reviews = itertools.chain(((True, review) for review in iter_reviews(data_path)),
+                                  ((False, review) for review in create_synthetic_professor_data()))
+        with self._deduplicating(dedup, reuse_decisions=reuse_decisions) as deduplicator:
+            for chunk in iter_chunks(reviews, chunk_size):
+                real = np.array([is_real for is_real, _ in chunk])
+                df = pd.DataFrame([review for _, review in chunk], columns=['professor', 'subject', 'stars', 'review'])
+                df = self.clean_reviews(df, dropped)
+                if deduplicator is not None:
+                    df = self.deduplicate_reviews(df, deduplicator, rows=real[df.index])
+                if len(df) > 0:
+                    yield df
+            if deduplicator is not None and dropped is not None:
+                dropped.update(deduplicator.dropped)
+    
+    def train_streaming(self, data_path='data/reviews.json', chunk_size=10000, n_epochs=2, n_features=2 ** 18,
+                        use_feature_cache=True, dedup=True):
+        """Train with bounded memory by streaming reviews chunk by chunk
+        
+        Uses a stateless HashingVectorizer instead of the fitted TF-IDF vocabulary and
+        SGD regressors updated with partial_fit. Every fifth review is held out for
+        evaluation. Only the distinct subjects are kept in memory across chunks.
+        With dedup=True every pass drops the same repeated and near-identical reviews.
+        """
+        print(f"Streaming training data from {data_path} in chunks of {chunk_size}...")
+        self._warn_if_fallback()
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, stop_words='english', alternate_sign=False, norm='l2'
+        )
+        
+        # First pass: subject vocabulary, feature ranges for scaling and target means
+        subjects = set()
+        max_length = 0
+        max_words = 0
+        total = 0
+        star_sum = 0.0
+        difficulty_sum = 0.0
+        dropped = {}
+        for df in self._iter_training_chunks(data_path, chunk_size, dedup, dropped):
+            subjects.update(df['subject'].fillna('Unknown'))
+            max_length = max(max_length, df['review'].str.len().fillna(0).max())
+            max_words = max(max_words, df['review'].str.split().str.len().fillna(0).max())
+            star_sum += df['stars'].sum()
+            difficulty_sum += np.clip(6 - df['stars'].values, 1, 5).sum()
+            total += len(df)
+        
+        if total == 0:
+            raise ValueError(f"No usable reviews found in {data_path}")
+        print(f"Found {total} reviews across {len(subjects)} subjects")
+        dropped = self._report_dropped(dropped)
+        
+        self.subject_encoder = LabelEncoder().fit(sorted(subjects))
+        
+        # Text columns are already l2-normalized, so only the extra features need scaling
+        feature_max = np.zeros(n_features + 3)
+        feature_max[n_features:] = [len(subjects) - 1, max_length, max_words]
+        scaler = MaxAbsScaler().fit(csr_matrix(feature_max))
+        
+        self.compiled_forests = None
+        self.rating_model = IncrementalRegressor(scaler, star_sum / total)
+        self.difficulty_model = IncrementalRegressor(scaler, difficulty_sum / total)
+        
+        # Training passes; later epochs reuse the cached preprocessing
+        with self._using_feature_cache(use_feature_cache):
+            for epoch in range(n_epochs):
+                print(f"Training epoch {epoch + 1}/{n_epochs}...")
+                offset = 0
+                for df in self._iter_training_chunks(data_path, chunk_size, dedup, reuse_decisions=True):
+                    train_mask = (np.arange(offset, offset + len(df)) % 5) != 0
+                    offset += len(df)
+                    if not train_mask.any():
+                        continue
+                
+                    X = self.extract_features(df[train_mask], is_training=False)
+                    y_rating = df['stars'].values[train_mask]
+                    y_difficulty = np.clip(6 - y_rating, 1, 5)  # Inverse relationship as heuristic
+                    self.rating_model.partial_fit(X, y_rating)
+                    self.difficulty_model.partial_fit(X, y_difficulty)
+        
+        # Evaluation pass over the held-out reviews with running sums
+        sums = {name: np.zeros(4) for name in ('rating', 'difficulty')}  # n, sum y, sum y^2, squared error
+        offset = 0
+        for df in self._iter_training_chunks(data_path, chunk_size, dedup):
+            test_mask = (np.arange(offset, offset + len(df)) % 5) == 0
+            offset += len(df)
+            if not test_mask.any():
+                continue
+            
+            X = self.extract_features(df[test_mask], is_training=False)
+            y_rating = df['stars'].values[test_mask]
+            for name, model, y in (('rating', self.rating_model, y_rating),
+                                   ('difficulty', self.difficulty_model, 6 - y_rating)):
+                pred = model.predict(X)
+                sums[name] += [len(y), y.sum(), (y ** 2).sum(), ((y - pred) ** 2).sum()]
+        
+        metrics = {}
+        for name, (n, sum_y, sum_y2, sse) in sums.items():
+            sst = sum_y2 - sum_y ** 2 / n if n else 0
+            metrics[f'{name}_r2'] = 1 - sse / sst if sst > 0 else 0.0
+            metrics[f'{name}_mse'] = sse / n if n else 0.0
+        
+        print(f"\nModel Performance:")
+        print(f"Rating Model - R²: {metrics['rating_r2']:.3f}, MSE: {metrics['rating_mse']:.3f}")
+        print(f"Difficulty Model - R²: {metrics['difficulty_r2']:.3f}, MSE: {metrics['difficulty_mse']:.3f}")
+        
+        # Save models
+        self.save_models(metrics, dict(self._full_training_info(iter_reviews(data_path), total_reviews=total),
+                                       dropped_rows=dropped))
+        
+        return metrics
     
     def predict_professor_metrics(self, professor_name, subject, sample_reviews):
         """Predict metrics for a professor based on review samples"""
-        # Create dataframe from samples
-        df = pd.DataFrame({
-            'professor': [professor_name] * len(sample_reviews),
-            'subject': [subject] * len(sample_reviews),
-            'review': sample_reviews,
-            'stars': [3] * len(sample_reviews)  # Placeholder
-        })
-        
-        # Extract features
-        X = self.extract_features(df, is_training=False)
+        predictions = self.predict_professor_metrics_batch([{
+            'professor': professor_name,
+            'subject': subject,
+            'reviews': sample_reviews
+        }])[0]
         
-        # Predict
-        predicted_ratings = self.rating_model.predict(X)
-        predicted_difficulty = self.difficulty_model.predict(X)
+        if predictions is None:
+            raise ValueError("At least one review is required for prediction")
         
-        return {
-            'avg_rating': np.mean(predicted_ratings),
-            'avg_difficulty': np.mean(predicted_difficulty),
-            'rating_consistency': np.std(predicted_ratings),
-            'individual_predictions': list(predicted_ratings)
-        }
+        return predictions
+    
+    def predict_professor_metrics_batch(self, groups):
+        """Predict metrics for many professors in a single featurize/predict pass
+        
+        Each group is a dict with 'reviews' and optionally 'professor' and 'subject'.
+        Returns one metrics dict per group, in order, with None for groups without reviews.
+        """
+        instrumentation = self.instrumentation
+        counts = np.array([len(group['reviews']) for group in groups], dtype=int)
+        results = [None] * len(groups)
+        instrumentation.count('groups_predicted', len(groups))
+        if counts.sum() == 0:
+            return results
+        
+        # Stack every group's reviews into one dataframe
+        with instrumentation.stage('predict.stack'):
+            df = pd.DataFrame({
+                'professor': [group.get('professor') for group in groups for _ in group['reviews']],
+                'subject': [group.get('subject') for group in groups for _ in group['reviews']],
+                'review': [review for group in groups for review in group['reviews']],
+                'stars': 3  # Placeholder
+            })
+        
+        # Extract features and run each forest once over the stacked matrix
+        X = self.extract_features(df, is_training=False)
+        with instrumentation.stage('predict.forests'):
+            if self.compiled_forests is not None:
+                predicted_ratings, predicted_difficulty = self.compiled_forests.predict(X)
+            else:
+                predicted_ratings = self.rating_model.predict(X)
+                predicted_difficulty = self.difficulty_model.predict(X)
+        
+        # Per-group reductions over contiguous segments
+        with instrumentation.stage('predict.aggregate'):
+            return summarize_groups(counts, predicted_ratings, predicted_difficulty)
     
     def generate_professor_insights(self, professor_data):
         """Generate insights about a professor"""
-        insights = []
-        
-        avg_rating = professor_data['avg_rating']
-        difficulty = professor_data['avg_difficulty']
-        consistency = professor_data['rating_consistency']
-        
-        # Rating insights
-        if avg_rating >= 4.5:
-            insights.append("Excellent professor with outstanding student satisfaction")
-        elif avg_rating >= 4.0:
-            insights.append("Very good professor with high student approval")
-        elif avg_rating >= 3.5:
-            insights.append("Good professor with generally positive reviews")
-        elif avg_rating >= 3.0:
-            insights.append("Average professor with mixed reviews")
-        else:
-            insights.append("Below average professor, consider alternatives")
-        
-        # Difficulty insights
-        if difficulty <= 2.0:
-            insights.append("Course is relatively easy")
-        elif difficulty <= 3.5:
-            insights.append("Moderate difficulty level")
-        else:
-            insights.append("Challenging course, requires significant effort")
-        
-        # Consistency insights
-        if consistency <= 0.5:
-            insights.append("Very consistent teaching quality")
-        elif consistency <= 1.0:
-            insights.append("Generally consistent performance")
-        else:
-            insights.append("Variable teaching quality across different aspects")
-        
-        return insights
-    
-    def save_models(self):
-        """Save trained models and preprocessors"""
-        import os
-        os.makedirs('models', exist_ok=True)
-        
-        joblib.dump(self.rating_model, 'models/rating_model.pkl')
-        joblib.dump(self.difficulty_model, 'models/difficulty_model.pkl')
-        joblib.dump(self.vectorizer, 'models/vectorizer.pkl')
-        joblib.dump(self.subject_encoder, 'models/subject_encoder.pkl')
-        joblib.dump(self.scaler, 'models/scaler.pkl')
-        print("Models saved to ./models/ directory")
+        return professor_insights(professor_data)
+    
+    def save_models(self, metrics=None, training_info=None, base_version=None):
+        """Publish trained models and preprocessors as a new bundle version
+        
+        With base_version, raises CurrentVersionChanged instead of publishing
+        when the current version is no longer base_version.
+        """
+        os.makedirs(self.model_dir, exist_ok=True)
+        
+        self.model_version = publish_bundle(self, self.model_dir, metrics, training_info, base_version=base_version)
+        print(f"Models saved to {self.model_dir} (version {self.model_version})")
+        
+        # A published full training satisfies any pending retrain request
+        marker = os.path.join(self.model_dir, RETRAIN_MARKER)
+        if (training_info or {}).get('mode') == 'full' and os.path.exists(marker):
+            os.remove(marker)
     
     def load_models(self):
         """Load pre-trained models"""
+        with self.instrumentation.stage('load_models'):
+            return self._load_models()
+    
+    def _load_models(self):
         try:
-            self.rating_model = joblib.load('models/rating_model.pkl')
-            self.difficulty_model = joblib.load('models/difficulty_model.pkl')
-            self.vectorizer = joblib.load('models/vectorizer.pkl')
-            self.subject_encoder = joblib.load('models/subject_encoder.pkl')
-            self.scaler = joblib.load('models/scaler.pkl')
+            bundle = load_bundle(self.model_dir)
+        except FileNotFoundError:
+            return self._load_legacy_models()
+        
+        try:
+            self.vectorizer = bundle.build_vectorizer()
+            self.subject_encoder = bundle.build_subject_encoder()
+            text_preprocessor = bundle.build_text_preprocessor()
+            if text_preprocessor is not None:
+                self.text_preprocessor = text_preprocessor
+            estimators = bundle.load_estimators()
+            if isinstance(estimators, CompiledForests):
+                self.compiled_forests = estimators
+            else:
+                self.compiled_forests = None
+                self.rating_model, self.difficulty_model = estimators
+            self.model_version = bundle.version
+            self.manifest = bundle.manifest
             return True
         except:
             return False
-
+    
+    def _load_legacy_models(self):
+        """Load models saved as separate pickles before bundles existed"""
+        path = lambda name: os.path.join(self.model_dir, name)
+        try:
+            self.vectorizer = joblib.load(path('vectorizer.pkl'))
+            self.subject_encoder = joblib.load(path('subject_encoder.pkl'))
+            self.scaler = joblib.load(path('scaler.pkl'))
+            if os.path.exists(path('forests.npy')):
+                self.compiled_forests = CompiledForests.load(path('forests.npy'))
+            else:
+                self.compiled_forests = None
+                self.rating_model = joblib.load(path('rating_model.pkl'))
+                self.difficulty_model = joblib.load(path('difficulty_model.pkl'))
+            self.model_version = 'legacy'
+            return True
+        except:
+            return False
+    
 def create_synthetic_professor_data():
     """Create additional synthetic professor data for training"""
     synthetic_reviews = [
@@ -309,17 +830,52 @@ def create_synthetic_professor_data():
 
 def main():
     """Main training pipeline"""
-    import os
+    parser = argparse.ArgumentParser(description='Train the professor recommendation models')
+    parser.add_argument('--data', default='data/reviews.json', help='Reviews as {"reviews": [...]} JSON or JSON Lines')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Train out-of-core with hashed features and incremental regressors')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Reviews per chunk in streaming mode')
+    parser.add_argument('--epochs', type=int, default=2, help='Passes over the data in streaming mode')
+    parser.add_argument('--models-dir', default=DEFAULT_MODEL_DIR, help='Directory model bundles are published to')
+    parser.add_argument('--no-feature-cache', action='store_true',
+                        help='Preprocess every review from scratch instead of using the per-review cache')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='Keep repeated and near-identical reviews instead of dropping them')
+    parser.add_argument('--search', action='store_true',
+                        help='Cross-validated search over n_estimators/max_depth/max_features before fitting')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Cores used for tree building and the search (-1 = all)')
+    parser.add_argument('--serial', action='store_true', help='Fit the two models one after the other')
+    parser.add_argument('--update', action='store_true',
+                        help='Fold reviews appended since the current version into the models instead of retraining')
+    parser.add_argument('--if-retrain-requested', action='store_true',
+                        help='Only run a full training if an incremental update asked for one (for scheduled jobs)')
+    parser.add_argument('--offline', action='store_true',
+                        help='Skip downloading the NLTK tokenizer and stopword data (use what is installed)')
+    args = parser.parse_args()
     
-    # Create models directory
-    os.makedirs('models', exist_ok=True)
+    if not args.offline:
+        download_nltk_data()
     
     # Initialize model
-    model = ProfessorRecommendationModel()
+    model = ProfessorRecommendationModel(args.models_dir, n_jobs=args.n_jobs)
+    
+    if args.update:
+        drift = model.update(args.data, dedup=not args.no_dedup)
+        if drift is not None:
+            print(f"Published version {model.model_version}; drift: {json.dumps(drift)}")
+        return
+    if args.if_retrain_requested and not model.retrain_requested():
+        print("No retrain requested")
+        return
     
     # Train the model
     print("Starting model training...")
-    results = model.train()
+    if args.streaming:
+        results = model.train_streaming(args.data, chunk_size=args.chunk_size, n_epochs=args.epochs,
+                                        use_feature_cache=not args.no_feature_cache, dedup=not args.no_dedup)
+    else:
+        results = model.train(args.data, use_feature_cache=not args.no_feature_cache,
+                              search=args.search, parallel=not args.serial, dedup=not args.no_dedup)
     
     # Test with synthetic data (only if training was successful)
     if results['rating_r2'] > -0.5:  # Only test if model shows some learning (less strict threshold)
@@ -352,7 +908,7 @@ def main():
     else:
         print("\nSkipping synthetic testing due to poor model performance")
     
-    print(f"\nTraining complete! Models saved to ./models/")
+    print(f"\nTraining complete! Models saved to {model.model_dir} (version {model.model_version})")
     print(f"Rating Model R²: {results['rating_r2']:.3f}")
     print(f"Difficulty Model R²: {results['difficulty_r2']:.3f}")
 